@@ -1,14 +1,616 @@
+#!/usr/bin/python3
+# Description: A command-line interface to ChatGPT, with a concurrent batch mode.
+# Usage: python3 chatgpt.py
+#        python3 chatgpt.py --batch prompts.jsonl [--output results.jsonl] [--concurrency 8] [--rpm 500] [--tpm 90000]
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
 import openai
 import os
+import re
 import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import hashlib
+import sqlite3
+import requests
 import shutil
-import textwrap
+import signal
+import functools
+import unicodedata
 from pathlib import Path
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 import colorama
 import readline
+import aiohttp
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 
 colorama.init()
 
+# Longest reply requested per turn
+REPLY_MAX_TOKENS = 150
+
+# Opt-in response cache: set CHATGPT_CACHE=1 (or a database path), or use 'cache=on'
+CACHE_FILE = os.path.expanduser("~/.chatgpt-cache.db")
+CACHE_MAX_BYTES = 20 * 1024 * 1024
+CACHE_MAX_AGE = 30 * 86400
+
+# Batch mode: retries per prompt and the backoff cap in seconds
+BATCH_RETRIES = 5
+BACKOFF_CAP = 30.0
+
+# Attachments are split into chunks of at most this many bytes, and this many of the chunks
+# most relevant to a question are sent along with it
+CHUNK_BYTES = 1500
+TOP_K = 4
+
+# Query words found in more than this share of the chunks say little about relevance
+COMMON_TERM_SHARE = 0.2
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Saved sessions: one append-only JSONL log per session plus a small index
+SESSIONS_DIR = os.path.expanduser(os.getenv("CHATGPT_SESSIONS", "~/.chatgpt-sessions"))
+SESSION_NAME = re.compile(r"^[\w.-]+$")
+
+# Request timings: set CHATGPT_METRICS to a file to also append them there as JSON lines
+METRICS_FILE = os.getenv("CHATGPT_METRICS")
+
+# Requests per model kept for the rolling 'stats' percentiles
+STATS_WINDOW = 200
+
+# Token budget for the history sent each turn (the reply's max_tokens come on top)
+HISTORY_TOKENS = int(os.getenv("CHATGPT_HISTORY_TOKENS", "3000"))
+
+# Room reserved inside the budget for the summary of older turns
+SUMMARY_TOKENS = 300
+
+# Each message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+# Once over budget, trim down to this share of it, so summarizing isn't needed every turn
+LOW_WATER = 0.75
+
+_encoding = None
+
+# Tokens in text: exact with tiktoken installed, otherwise about 4 characters per token
+def count_tokens(text):
+    global _encoding
+    if tiktoken is not None and _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+# Cut text down to at most the given number of tokens, marking the cut
+def truncate_to_tokens(text, tokens, marker="\n[truncated]"):
+    if count_tokens(text) <= tokens:
+        return text
+    keep = max(0, tokens - count_tokens(marker))
+    if _encoding:
+        return _encoding.decode(_encoding.encode(text)[:keep]) + marker
+    return text[:keep * 4] + marker
+
+# Conversation sent to the API, kept within a token budget: every message's token count is
+# worked out once, the newest turns are kept in a sliding window and the turns that slide out
+# are folded into a running summary (or dropped if summarizing fails)
+class ConversationHistory:
+    def __init__(self, budget=HISTORY_TOKENS, summarizer=None):
+        self.budget = budget
+        self.summarizer = summarizer  # summarizer(previous summary, [messages]) -> text
+        self.session = None  # ChatSession that every new message is appended to
+        self.clear()
+
+    def clear(self):
+        self.messages = []  # [(message, tokens), ...]
+        self.tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+
+    def append(self, role, content, log=True):
+        # A single message may not take more than the whole window (e.g. a large attach=)
+        content = truncate_to_tokens(content, self.budget - SUMMARY_TOKENS - MESSAGE_OVERHEAD)
+        tokens = count_tokens(content) + MESSAGE_OVERHEAD
+        self.messages.append(({"role": role, "content": content}, tokens))
+        self.tokens += tokens
+        if log and self.session is not None:
+            self.session.append(role, content)
+
+    # Slide the window once the payload is over budget, summarizing what slides out
+    def trim(self):
+        if self.tokens + self.summary_tokens <= self.budget:
+            return
+        evicted = []
+        reserve = self.summary_tokens  # room for the summary, once there is one
+        while len(self.messages) > 1 and self.tokens + reserve > self.budget * LOW_WATER:
+            message, tokens = self.messages.pop(0)
+            self.tokens -= tokens
+            evicted.append(message)
+            reserve = SUMMARY_TOKENS
+        if evicted and self.summarizer is not None:
+            try:
+                room = SUMMARY_TOKENS - count_tokens(SUMMARY_PREFIX) - MESSAGE_OVERHEAD
+                self.summary = truncate_to_tokens(self.summarizer(self.summary, evicted), room)
+                self.summary_tokens = count_tokens(SUMMARY_PREFIX + self.summary) + MESSAGE_OVERHEAD
+            except Exception as e:
+                print_imessage("ChatGPT", f"Could not summarize older messages ({e}); they were dropped.", is_user=False)
+
+    # The messages to send this turn: the summary, if any, then the window
+    def payload(self):
+        self.trim()
+        messages = [m for m, _ in self.messages]
+        if self.summary:
+            messages.insert(0, {"role": "system", "content": SUMMARY_PREFIX + self.summary})
+        return messages
+
+    def describe(self):
+        summary = f", plus a {self.summary_tokens}-token summary of earlier turns" if self.summary else ""
+        return f"{len(self.messages)} messages, {self.tokens} of {self.budget} tokens{summary}."
+
+# Fold messages that no longer fit into the running summary with a short completion
+def summarize_history(model, summary, messages):
+    transcript = "\n".join(f"{m['role']}: {truncate_to_tokens(m['content'], 500)}" for m in messages)
+    prompt = (f"Previous summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}\n\n"
+              "Update the summary of this conversation in a few sentences, keeping names, facts and decisions.")
+    start = time.perf_counter()
+    ConnectTimer.seconds = 0.0
+    response = openai.ChatCompletion.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=SUMMARY_TOKENS
+    )
+    elapsed = time.perf_counter() - start
+    tokens = (response.get("usage") or {}).get("completion_tokens")
+    STATS.record(model, connect=round(ConnectTimer.seconds, 4), first_token=None, total=round(elapsed, 4),
+                 tokens=tokens, render=None, summary=True,
+                 tokens_per_second=round(tokens / elapsed, 1) if tokens and elapsed > 0 else None)
+    return response['choices'][0]['message']['content'].strip()
+
+# On-disk cache of complete replies, keyed by a hash of the request. Entries older than
+# max_age are dropped, and the least recently used go first once the replies pass max_bytes
+class ResponseCache:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS replies (
+        key       TEXT PRIMARY KEY,
+        model     TEXT NOT NULL,
+        reply     TEXT NOT NULL,
+        bytes     INTEGER NOT NULL,
+        created   REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS replies_last_used ON replies (last_used);
+    CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+
+    def __init__(self, path=CACHE_FILE, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    # Same model, same conversation (ignoring surrounding whitespace and line endings) and
+    # same parameters give the same key
+    @staticmethod
+    def key(model, messages, params):
+        normalized = [[m["role"], m["content"].replace("\r\n", "\n").strip()] for m in messages]
+        data = json.dumps([model, normalized, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _count(self, name):
+        self.db.execute("INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        now = time.time()
+        with self.db:
+            row = self.db.execute("SELECT reply FROM replies WHERE key = ? AND created > ?",
+                                  (key, now - self.max_age)).fetchone()
+            if row:
+                self.db.execute("UPDATE replies SET last_used = ? WHERE key = ?", (now, key))
+            self._count("hits" if row else "misses")
+        if row:
+            self.hits += 1
+            return row[0]
+        self.misses += 1
+        return None
+
+    def put(self, key, model, reply):
+        now = time.time()
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO replies VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, model, reply, len(reply.encode("utf-8")), now, now))
+            self.evict(now)
+
+    def evict(self, now):
+        self.db.execute("DELETE FROM replies WHERE created <= ?", (now - self.max_age,))
+        total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM replies").fetchone()[0]
+        if total > self.max_bytes:
+            # Walk from least to most recently used until enough bytes are freed
+            excess = total - self.max_bytes
+            stale = []
+            for key, size in self.db.execute("SELECT key, bytes FROM replies ORDER BY last_used"):
+                stale.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self.db.executemany("DELETE FROM replies WHERE key = ?", stale)
+
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM replies")
+            self.db.execute("DELETE FROM counters")
+        self.hits = self.misses = 0
+
+    def describe(self):
+        entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM replies").fetchone()
+        counters = dict(self.db.execute("SELECT name, value FROM counters"))
+        def rate(hits, misses):
+            return f"{hits / (hits + misses) * 100:.0f}%" if hits + misses else "n/a"
+        return (f"{entries} cached replies ({size / 1024:.1f} KiB) in {self.path}.\n"
+                f"This session: {self.hits} hits, {self.misses} misses, hit rate {rate(self.hits, self.misses)}.\n"
+                f"All time: hit rate {rate(counters.get('hits', 0), counters.get('misses', 0))}.")
+
+    def close(self):
+        self.db.close()
+
+# The cache named by setting (CHATGPT_CACHE by default); None if that is off or the database
+# can't be opened, e.g. an unwritable directory or a locked or corrupt file
+def open_cache(setting=None):
+    setting = os.getenv("CHATGPT_CACHE", "") if setting is None else setting
+    if not setting or setting.lower() in ("0", "off", "no"):
+        return None
+    path = CACHE_FILE if setting.lower() in ("1", "on", "yes") else os.path.expanduser(setting)
+    try:
+        return ResponseCache(path)
+    except sqlite3.Error as e:
+        print(f"⚠️ Response cache disabled ({path}: {e})")
+        return None
+
+# A query word as the index's tokenizer stores terms: lower case, with diacritics removed
+def fold_term(word):
+    decomposed = unicodedata.normalize("NFD", word.lower())
+    return unicodedata.normalize("NFC", "".join(ch for ch in decomposed if not unicodedata.combining(ch)))
+
+# Attached files, split into chunks and indexed for BM25 ranking (SQLite FTS5) in a temporary
+# database on disk. Only chunk offsets are kept; a chunk's text is read back from its file when
+# it is sent, so memory use stays flat however large the files are. A file's size and mtime are
+# kept too: once it is edited, moved or deleted its offsets mean nothing, and it is detached
+class AttachmentIndex:
+    SCHEMA = """
+    CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT NOT NULL, name TEXT NOT NULL, bytes INTEGER NOT NULL,
+                        mtime INTEGER NOT NULL);
+    CREATE TABLE chunks (id INTEGER PRIMARY KEY, file INTEGER NOT NULL, offset INTEGER NOT NULL,
+                         length INTEGER NOT NULL, line INTEGER NOT NULL);
+    CREATE VIRTUAL TABLE chunk_text USING fts5(text, content='', tokenize='unicode61 remove_diacritics 2');
+    CREATE VIRTUAL TABLE chunk_terms USING fts5vocab(chunk_text, 'row');
+    """
+
+    def __init__(self):
+        self.db = sqlite3.connect("")  # private temporary database, kept on disk
+        self.db.executescript(self.SCHEMA)
+        self.names = []
+        self.chunks = 0
+
+    # Lines of a binary file, those longer than chunk_bytes split into pieces that end on a
+    # UTF-8 character boundary, so no chunk starts or ends in the middle of a character
+    @staticmethod
+    def read_lines(f, chunk_bytes):
+        carry = b""
+        while True:
+            line = carry + f.readline(chunk_bytes - len(carry))
+            if not line:
+                return
+            carry = b""
+            if not line.endswith(b"\n"):
+                # Step back over continuation bytes to the last character's first byte
+                start = len(line) - 1
+                while start > 0 and len(line) - start < 4 and line[start] & 0xC0 == 0x80:
+                    start -= 1
+                lead = line[start]
+                needed = 4 if lead >= 0xF0 else 3 if lead >= 0xE0 else 2 if lead >= 0xC0 else 1
+                if start > 0 and len(line) - start < needed:
+                    line, carry = line[:start], line[start:]
+            yield line
+
+    # Stream a file as (offset, length, first line number, bytes) chunks that end on line
+    # boundaries where possible (lines longer than a chunk are split between characters)
+    @classmethod
+    def read_chunks(cls, path, chunk_bytes=CHUNK_BYTES):
+        with open(path, "rb") as f:
+            offset = 0
+            line_number = start_line = 1
+            parts = []
+            size = 0
+            for line in cls.read_lines(f, chunk_bytes):
+                if parts and size + len(line) > chunk_bytes:
+                    yield offset, size, start_line, b"".join(parts)
+                    offset += size
+                    start_line = line_number
+                    parts = []
+                    size = 0
+                parts.append(line)
+                size += len(line)
+                if line.endswith(b"\n"):
+                    line_number += 1
+            if parts:
+                yield offset, size, start_line, b"".join(parts)
+
+    # Index a text file; returns its number of chunks
+    def add(self, path):
+        with open(path, "rb") as f:
+            info = os.fstat(f.fileno())
+            if b"\0" in f.read(8192):
+                raise ValueError("not a text file")
+        first = self.chunks
+        with self.db:
+            file_id = self.db.execute("INSERT INTO files (path, name, bytes, mtime) VALUES (?, ?, ?, ?)",
+                                      (os.path.abspath(path), os.path.basename(path), info.st_size, info.st_mtime_ns)).lastrowid
+            batch = []
+            for offset, length, line, data in self.read_chunks(path):
+                self.chunks += 1
+                batch.append((self.chunks, offset, length, line, data.decode("utf-8", "replace")))
+                if len(batch) >= 1000:
+                    self._insert(file_id, batch)
+                    batch = []
+            self._insert(file_id, batch)
+        self.names.append(os.path.basename(path))
+        return self.chunks - first
+
+    def _insert(self, file_id, batch):
+        self.db.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+                            [(chunk_id, file_id, offset, length, line) for chunk_id, offset, length, line, _ in batch])
+        self.db.executemany("INSERT INTO chunk_text (rowid, text) VALUES (?, ?)",
+                            [(chunk_id, text) for chunk_id, _, _, _, text in batch])
+
+    # Forget an attached file. FTS5 can't delete from a contentless table without the original
+    # text, so its chunks stay in chunk_text but drop out of every search with their chunks rows
+    def detach(self, file_id):
+        with self.db:
+            name = self.db.execute("SELECT name FROM files WHERE id = ?", (file_id,)).fetchone()[0]
+            self.db.execute("DELETE FROM chunks WHERE file = ?", (file_id,))
+            self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        self.names.remove(name)
+
+    # The k chunks ranking highest for a question: [(file name, first line, text), ...] in file order.
+    # Files that changed or went away since they were attached are detached, with a note, and skipped
+    def retrieve(self, question, k=TOP_K):
+        words = list({fold_term(w) for w in WORD_PATTERN.findall(question) if len(w) > 1})
+        if not words or not self.chunks:
+            return []
+        placeholders = ",".join("?" * len(words))
+        found = sorted((doc, term) for term, doc in
+                       self.db.execute(f"SELECT term, doc FROM chunk_terms WHERE term IN ({placeholders})", words))
+        if not found:
+            return []
+        # Leave out words that are everywhere, unless nothing rarer is left
+        terms = [term for doc, term in found if doc <= max(1, self.chunks * COMMON_TERM_SHARE)] or [found[0][1]]
+        query = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        ids = [row[0] for row in self.db.execute(
+            "SELECT rowid FROM chunk_text WHERE chunk_text MATCH ? AND rowid IN (SELECT id FROM chunks) "
+            "ORDER BY rank LIMIT ?", (query, k))]
+        if not ids:
+            return []
+        rows = self.db.execute(
+            f"SELECT f.id, f.path, f.name, f.bytes, f.mtime, c.offset, c.length, c.line FROM chunks c "
+            f"JOIN files f ON f.id = c.file WHERE c.id IN ({','.join('?' * len(ids))}) ORDER BY c.file, c.offset", ids).fetchall()
+        excerpts = []
+        stale = {}  # {file id: (name, reason)}
+        for file_id, path, name, size, mtime, offset, length, line in rows:
+            if file_id in stale:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    info = os.fstat(f.fileno())
+                    if (info.st_size, info.st_mtime_ns) != (size, mtime):
+                        stale[file_id] = name, "it has changed since it was attached"
+                        continue
+                    f.seek(offset)
+                    excerpts.append((name, line, f.read(length).decode("utf-8", "replace")))
+            except OSError as e:
+                stale[file_id] = name, f"it can no longer be read ({e.strerror or e})"
+        for file_id, (name, reason) in stale.items():
+            self.detach(file_id)
+            print_imessage("ChatGPT", f"Detached '{name}': {reason}. Attach it again to use it.", is_user=False)
+        return excerpts
+
+    def close(self):
+        self.db.close()
+
+# The system message carrying a turn's attachment excerpts
+def excerpts_message(excerpts):
+    parts = [f"[{name}, from line {line}]\n```\n{text.strip()}\n```" for name, line, text in excerpts]
+    return {"role": "system", "content": "Excerpts from the attached files that may help with the next question:\n\n" + "\n\n".join(parts)}
+
+# One saved session: its log is only ever appended to, one message per line. The index is
+# updated once, on close, rather than rewritten for every message
+class ChatSession:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.path = store.path(name)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.start_bytes = os.fstat(self.file.fileno()).st_size
+        self.messages = 0
+        self.title = ""
+
+    def append(self, role, content):
+        line = json.dumps({"role": role, "content": content, "ts": time.time()}, ensure_ascii=False) + "\n"
+        self.file.write(line)
+        self.file.flush()
+        self.messages += 1
+        if role == "user" and not self.title:
+            self.title = content[:60]
+
+    def close(self):
+        self.file.close()
+        if self.messages:
+            self.store.record(self.name, self.start_bytes, self.messages, self.title)
+
+# Directory of saved sessions. index.json keeps each session's message count, size, last
+# update and title, so listing never reads the logs. An entry whose size no longer matches its
+# log (a crash before close, another process writing) is rescanned from the log
+class SessionStore:
+    def __init__(self, directory=SESSIONS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.json")
+        self.index = self.read_index()
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.jsonl")
+
+    def names(self):
+        return [filename[:-len(".jsonl")] for filename in os.listdir(self.directory) if filename.endswith(".jsonl")]
+
+    # An index entry for one log, read from the log itself
+    def scan(self, name):
+        path = self.path(name)
+        entry = {"messages": 0, "bytes": os.path.getsize(path), "updated": os.path.getmtime(path), "title": ""}
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                entry["messages"] += 1
+                if not entry["title"] and '"role": "user"' in line:
+                    try:
+                        entry["title"] = json.loads(line)["content"][:60]
+                    except (ValueError, KeyError, TypeError):
+                        pass
+        return entry
+
+    def read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return self.rebuild_index()
+
+    def rebuild_index(self):
+        self.index = {}
+        for name in self.names():
+            try:
+                self.index[name] = self.scan(name)
+            except OSError:
+                pass  # removed meanwhile
+        self.save_index()
+        return self.index
+
+    # Replace index.json in one step; the temporary file is per process so two writers never
+    # share one
+    def save_index(self):
+        temp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(temp, self.index_path)
+
+    # Fold a closed session's new messages into the index, merged with the index as it is on disk
+    # now (other processes may have saved theirs since we read it). If the entry doesn't end
+    # where this session started appending, it is rescanned instead
+    def record(self, name, start_bytes, messages, title):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            pass  # keep ours; it is rewritten below
+        entry = self.index.get(name)
+        if entry is None and start_bytes == 0:
+            entry = self.index[name] = {"messages": 0, "bytes": 0, "updated": 0, "title": ""}
+        try:
+            size = os.path.getsize(self.path(name))
+            if entry is not None and entry["bytes"] == start_bytes:
+                entry["messages"] += messages
+                entry["bytes"] = size
+                entry["updated"] = time.time()
+                if title and not entry["title"]:
+                    entry["title"] = title
+            else:
+                self.index[name] = self.scan(name)
+            self.save_index()
+        except OSError as e:
+            print(f"⚠️ Could not update the session index: {e}")
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    # Sessions, most recently updated first: [(name, entry), ...]. Only the logs' sizes are
+    # checked; a log whose entry is missing or out of date is rescanned
+    def list(self):
+        names = set(self.names())
+        changed = False
+        for name in names:
+            entry = self.index.get(name)
+            try:
+                if entry is None or entry["bytes"] != os.path.getsize(self.path(name)):
+                    self.index[name] = self.scan(name)
+                    changed = True
+            except OSError:
+                names.discard(name)
+        for name in set(self.index) - names:
+            del self.index[name]
+            changed = True
+        if changed:
+            try:
+                self.save_index()
+            except OSError as e:
+                print(f"⚠️ Could not update the session index: {e}")
+        return sorted(self.index.items(), key=lambda item: item[1]["updated"], reverse=True)
+
+    def open(self, name):
+        return ChatSession(self, name)
+
+    # The newest messages of a session that fit in budget tokens, oldest first, or None if its
+    # log can't be read. The log is read backwards from its end in blocks, so resuming a long
+    # session doesn't read all of it
+    def tail(self, name, budget, block=65536):
+        try:
+            return self._tail(name, budget, block)
+        except OSError as e:
+            print(f"⚠️ Could not read session '{name}': {e}")
+            return None
+
+    def _tail(self, name, budget, block):
+        messages = []
+        tokens = 0
+        with open(self.path(name), "rb") as f:
+            position = f.seek(0, os.SEEK_END)
+            rest = b""
+            while position > 0:
+                step = min(block, position)
+                position -= step
+                f.seek(position)
+                lines = (f.read(step) + rest).split(b"\n")
+                # Unless this is the start of the file, the first piece continues in the block before
+                rest = lines.pop(0) if position > 0 else b""
+                for line in reversed(lines):
+                    try:
+                        message = json.loads(line)
+                        role, content = message["role"], message["content"]
+                    except (ValueError, KeyError, TypeError):
+                        continue  # blank, or cut short by a crash
+                    cost = count_tokens(content) + MESSAGE_OVERHEAD
+                    if tokens + cost > budget and messages:
+                        return messages[::-1]
+                    messages.append({"role": role, "content": content})
+                    tokens += cost
+        return messages[::-1]
+
 def get_api_key():
     # Check if API key is already set in the current environment
     api_key = os.getenv("OPENAI_API_KEY")
@@ -69,45 +671,377 @@ Available Commands:
 - 'model=<model_name>' : Switch to the specified model (e.g., 'model=gpt-4').
 - 'output'    : Save the last ChatGPT response to a file (auto-named).
 - 'output=<filename>' : Save the last ChatGPT response to the given filename.
-- 'attach=<filename>' : Attach a local file's contents and send it as part of the conversation.
+- 'attach=<filename>' : Attach a local file; the parts most relevant to each question are sent with it.
+- 'detach'    : Remove all attached files.
+- 'cache'     : Show the response cache's size and hit rate.
+- 'cache=on|off|clear' : Turn the on-disk response cache on or off, or empty it.
+- 'save'      : Save this conversation as a session (auto-named); later messages are added as they happen.
+- 'save=<name>' : Save this conversation as the named session.
+- 'load=<name>' : Resume a saved session ('load' alone resumes the most recent one).
+- 'sessions'  : List saved sessions.
+- 'stats'     : Show p50/p95 connect, first-token, total and tokens/s timings per model.
+- 'history'   : Show how much of the history token budget is in use.
+- 'history=<tokens>' : Change the history token budget (older turns are summarized to fit).
 """
     print(help_text)
 
-def print_imessage(sender, text, is_user=False):
-    cols = shutil.get_terminal_size().columns
-    max_bubble_width = min(60, cols - 10)
-    indent = cols - max_bubble_width - 6 if is_user else 2
-    wrapper = textwrap.TextWrapper(width=max_bubble_width)
-    lines = wrapper.wrap(text.strip())
+RESET = "\033[0m"
+
+# Wrapping tokens: runs of whitespace and runs of anything else
+WRAP_TOKEN = re.compile(r"\s+|\S+")
+
+# Terminal cells taken by a character: none for combining marks and format characters such
+# as zero-width joiners, two for wide East Asian characters and most emoji
+@functools.lru_cache(maxsize=8192)
+def char_width(ch):
+    if unicodedata.combining(ch) or unicodedata.category(ch) in ("Mn", "Me", "Cf", "Cc"):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1
+
+# Skin tone modifiers recolour the emoji before them rather than taking cells of their own
+SKIN_TONES = ("\U0001F3FB", "\U0001F3FF")
+
+# Cells each character of text adds to its width
+def char_cells(text):
+    previous = 0  # cells of the last character that took any
+    joined = False
+    for ch in text:
+        if ch == "\ufe0f":
+            cells = 1 if previous == 1 else 0  # emoji presentation selector: the preceding symbol becomes double width
+        elif SKIN_TONES[0] <= ch <= SKIN_TONES[1] and previous == 2:
+            cells = 0
+        else:
+            cells = 0 if joined else char_width(ch)  # emoji joined by ZWJ share one glyph
+            joined = ch == "\u200d"
+        if cells:
+            previous = 2 if ch == "\ufe0f" else cells
+        yield cells
+
+def text_width(text):
+    if text.isascii():
+        return len(text)
+    return sum(char_cells(text))
 
+# Split one line (no newlines) into rows of at most width cells as (start, end) spans:
+# breaks at whitespace where possible, inside words longer than a row otherwise
+def wrap_spans(line, width):
+    spans = []
+    start = 0
+    used = 0
+    for match in WRAP_TOKEN.finditer(line):
+        token = match.group()
+        cells = text_width(token)
+        if token.isspace():
+            if used + cells <= width:
+                used += cells
+            else:
+                spans.append((start, match.start()))
+                start = match.end()
+                used = 0
+            continue
+        if used and used + cells > width:
+            spans.append((start, match.start()))
+            start = match.start()
+            used = 0
+        if cells > width:
+            for i, cell in enumerate(char_cells(token), match.start()):
+                if used + cell > width:
+                    spans.append((start, i))
+                    start = i
+                    used = 0
+                used += cell
+            continue
+        used += cells
+    spans.append((start, len(line)))
+    return spans
+
+def wrap_line(line, width):
+    return [line[a:b].rstrip() for a, b in wrap_spans(line, width)]
+
+def bubble_layout(is_user, columns):
+    max_bubble_width = min(60, columns - 10)
+    indent = columns - max_bubble_width - 6 if is_user else 2
     color = "\033[44m" if is_user else "\033[100m"
-    reset = "\033[0m"
-    top = f"{color}╭{'─' * (max_bubble_width + 2)}╮{reset}"
-    bottom = f"{color}╰{'─' * (max_bubble_width + 2)}╯{reset}"
+    return max_bubble_width, indent, color
+
+def bubble_row(text, width, indent, color):
+    return " " * indent + f"{color}│ {text}{' ' * (width - text_width(text))} │{RESET}"
+
+# A whole bubble as one string, laid out for a terminal width; cached, so redrawing the same
+# messages (e.g. after a resize back) costs nothing. Line breaks in the text are kept
+@functools.lru_cache(maxsize=256)
+def render_bubble(text, is_user, note, columns):
+    width, indent, color = bubble_layout(is_user, columns)
+    rows = [" " * indent + f"{color}╭{'─' * (width + 2)}╮{RESET}"]
+    for line in text.strip().replace("\t", "    ").split("\n"):
+        rows.extend(bubble_row(row, width, indent, color) for row in wrap_line(line, width))
+    rows.append(" " * indent + f"{color}╰{'─' * (width + 2)}╯{RESET}")
+    if note:
+        rows.append(" " * indent + f"\033[2m{note}{RESET}")
+    return "\n".join(rows) + "\n\n"
+
+# Draws bubbles with one write each and keeps the recent ones, so that after a terminal
+# resize the screen can be redrawn from the newest bubbles back to the top of the window
+class BubbleRenderer:
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.columns, self.lines = shutil.get_terminal_size()
+        self.history = deque(maxlen=200)  # (text, is_user, note)
+        self.resized = False
+        self.prompt = None  # prompt on screen while waiting for input
+
+    # Follow terminal resizes (where the platform reports them)
+    def install(self):
+        if hasattr(signal, "SIGWINCH"):
+            signal.signal(signal.SIGWINCH, self.on_resize)
+
+    def on_resize(self, signum, frame):
+        self.columns, self.lines = shutil.get_terminal_size()
+        if self.prompt is not None:
+            self.redraw()
+            self.out.write(self.prompt + readline.get_line_buffer())
+            self.out.flush()
+        else:
+            self.resized = True  # redraw before the next bubble, not in the middle of one
+
+    def redraw(self):
+        self.resized = False
+        blocks = []
+        rows = 0
+        for entry in reversed(self.history):
+            if rows >= self.lines:
+                break
+            block = render_bubble(*entry, self.columns)
+            blocks.append(block)
+            rows += block.count("\n")
+        self.out.write("\033[2J\033[H" + "".join(reversed(blocks)))
 
-    print(" " * indent + top)
-    for line in lines:
-        pad = " " * (max_bubble_width - len(line))
-        print(" " * indent + f"{color}│ {line}{pad} │{reset}")
-    print(" " * indent + bottom + "\n")
+    def remember(self, text, is_user=False, note=""):
+        self.history.append((text, is_user, note))
+
+    def bubble(self, text, is_user=False, note=""):
+        if self.resized:
+            self.redraw()
+        self.remember(text, is_user, note)
+        self.out.write(render_bubble(text, is_user, note, self.columns))
+        self.out.flush()
+
+RENDERER = BubbleRenderer()
+
+def print_imessage(sender, text, is_user=False, note=""):
+    RENDERER.bubble(text, is_user, note)
+
+# A ChatGPT bubble that fills in as a reply streams: finished rows are printed once and the
+# row still being written is redrawn in place. Nothing is drawn until the first text arrives.
+class StreamingBubble:
+    def __init__(self, renderer=RENDERER):
+        self.renderer = renderer
+        if renderer.resized:
+            renderer.redraw()
+        self.width, self.indent, self.color = bubble_layout(False, renderer.columns)
+        self.parts = []
+        self.line = ""  # the source line still being received
+        self.blank = []  # blank rows not drawn yet
+        self.opened = False
+
+    def row(self, text):
+        return "\r" + bubble_row(text, self.width, self.indent, self.color) + "\n"
+
+    def write(self, text):
+        self.parts.append(text)
+        text = text.replace("\t", "    ")
+        out = []
+        if not self.opened:
+            text = text.lstrip()
+            if not text:
+                return
+            out.append(" " * self.indent + f"{self.color}╭{'─' * (self.width + 2)}╮{RESET}\n")
+            self.opened = True
+        *finished, self.line = (self.line + text).split("\n")
+        rows = [row for line in finished for row in wrap_line(line, self.width)]
+        # Every row of the current line but the last is final: later text can't pull words back onto
+        # it. Trailing whitespace is left out, as more of it may arrive and decide where the break goes
+        spans = wrap_spans(self.line.rstrip(), self.width)
+        rows += [self.line[a:b].rstrip() for a, b in spans[:-1]]
+        self.line = self.line[spans[-1][0]:]
+        # Blank rows are held back until text follows them: trailing ones are dropped, as in render_bubble
+        for row in rows:
+            self.blank.append(row)
+            if row:
+                out.extend(self.row(held) for held in self.blank)
+                self.blank = []
+        if self.line.strip():
+            out.extend(self.row(held) for held in self.blank)
+            self.blank = []
+        out.append("\r" + bubble_row(self.line.rstrip(), self.width, self.indent, self.color))
+        self.renderer.out.write("".join(out))
+        self.renderer.out.flush()
+
+    def close(self, note=""):
+        if not self.opened:
+            return
+        out = ["\n" if self.line.strip() else "\r\033[K"]  # drop a trailing empty row (and the held-back blanks)
+        out.append(" " * self.indent + f"{self.color}╰{'─' * (self.width + 2)}╯{RESET}\n")
+        if note:
+            out.append(" " * self.indent + f"\033[2m{note}{RESET}\n")
+        out.append("\n")
+        self.renderer.out.write("".join(out))
+        self.renderer.out.flush()
+        self.renderer.remember("".join(self.parts), False, note)
+
+# Seconds spent opening connections (DNS, TCP and TLS); a request that reuses a kept-alive
+# connection adds nothing
+class ConnectTimer:
+    seconds = 0.0
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            ConnectTimer.seconds += time.perf_counter() - start
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            ConnectTimer.seconds += time.perf_counter() - start
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+# The openai library closes its session every few minutes; this one keeps its warm
+# connections for the life of the program
+class PooledSession(requests.Session):
+    def close(self):
+        pass
+
+def make_session(pool_size=4):
+    session = PooledSession()
+    adapter = TimedAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def percentile(ordered, share):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+# Timings of recent requests per model, for 'stats', and optionally a JSON-lines dump
+class RequestStats:
+    FIELDS = ("connect", "first_token", "total", "tokens_per_second", "render")
+
+    def __init__(self, metrics_file=METRICS_FILE):
+        self.by_model = {}
+        self.metrics_file = metrics_file
+
+    def record(self, model, **metrics):
+        metrics = {"ts": time.time(), "model": model, **metrics}
+        self.by_model.setdefault(model, deque(maxlen=STATS_WINDOW)).append(metrics)
+        if self.metrics_file:
+            try:
+                with open(self.metrics_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(metrics) + "\n")
+            except OSError as e:
+                print(f"⚠️ Could not write metrics to {self.metrics_file}: {e}")
+
+    def describe(self):
+        if not self.by_model:
+            return "No requests timed yet."
+        lines = []
+        for model, records in self.by_model.items():
+            reused = sum(1 for r in records if not r["connect"])
+            lines.append(f"{model}: {len(records)} requests, {reused} on a kept-alive connection")
+            for field in self.FIELDS:
+                values = sorted(r[field] for r in records if r.get(field) is not None)
+                if values:
+                    unit, digits = (" tok/s", 1) if field == "tokens_per_second" else ("s", 3)
+                    lines.append(f"  {field.replace('_', ' ')}: p50 {percentile(values, 0.5):.{digits}f}{unit}, "
+                                 f"p95 {percentile(values, 0.95):.{digits}f}{unit}")
+        return "\n".join(lines)
+
+STATS = RequestStats()
+
+# Stream a reply into a bubble as it is generated. Ctrl-C stops generation and keeps what
+# arrived so far. Returns (reply text, seconds to first token or None, cancelled)
+def stream_reply(model, messages):
+    start = time.perf_counter()
+    ConnectTimer.seconds = 0.0
+    first_token = None
+    render = 0.0
+    parts = []
+    bubble = StreamingBubble()
+    cancelled = False
+    response = None
+    try:
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=messages,
+            max_tokens=REPLY_MAX_TOKENS,
+            stream=True
+        )
+        for chunk in response:
+            choices = chunk.get("choices") or [{}]
+            text = choices[0].get("delta", {}).get("content")
+            if text:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                parts.append(text)
+                rendered = time.perf_counter()
+                bubble.write(text)
+                render += time.perf_counter() - rendered
+    except KeyboardInterrupt:
+        cancelled = True
+    finally:
+        if response is not None and hasattr(response, "close"):
+            response.close()
+        elapsed = time.perf_counter() - start
+        note = f"first token {first_token:.2f}s · {elapsed:.2f}s total" if first_token is not None else ""
+        if cancelled:
+            note = (note + " · " if note else "") + "cancelled"
+        bubble.close(note)
+        if first_token is not None:
+            # Streamed chunks carry no usage counts, so the reply's tokens are counted here
+            tokens = count_tokens("".join(parts))
+            generating = elapsed - first_token
+            STATS.record(model, connect=round(ConnectTimer.seconds, 4), first_token=round(first_token, 4),
+                         total=round(elapsed, 4), tokens=tokens, render=round(render, 4), cancelled=cancelled,
+                         tokens_per_second=round(tokens / generating, 1) if generating > 0 else None)
+    return "".join(parts), first_token, cancelled
 
 def read_input_silently(prompt="You: "):
     try:
         print(prompt, end="", flush=True)
+        RENDERER.prompt = prompt
         user_input = input()
         sys.stdout.write("\033[F\033[K")  # Move cursor up and clear line
         return user_input.strip()
     except EOFError:
         return ""
+    finally:
+        RENDERER.prompt = None
 
 def chat_with_gpt():
     current_model = "gpt-3.5-turbo"
     available_models = ["gpt-3.5-turbo", "gpt-4"]
     last_response = ""
 
+    RENDERER.install()
     print_imessage("ChatGPT", f"Hello. You are currently using the '{current_model}' model.\nType 'help' for a list of internal commands.", is_user=False)
 
-    conversation_history = []
+    conversation_history = ConversationHistory(summarizer=lambda summary, messages: summarize_history(current_model, summary, messages))
+    cache = open_cache()
+    attachments = None  # AttachmentIndex, created by the first attach=
 
     while True:
         user_input = read_input_silently()
@@ -122,10 +1056,77 @@ def chat_with_gpt():
 
         if user_input.lower() == "new":
             print_imessage("ChatGPT", f"Starting a new conversation...\nHello. You are using the '{current_model}' model. How can I help you today?", is_user=False)
-            conversation_history = []
+            conversation_history.clear()
+            if conversation_history.session:
+                conversation_history.session.close()
+                conversation_history.session = None
+            if attachments:
+                attachments.close()
+                attachments = None
             last_response = ""
             continue
 
+        if user_input.lower() == "stats":
+            print_imessage("ChatGPT", STATS.describe(), is_user=False)
+            continue
+
+        if user_input.lower() == "sessions":
+            sessions = SessionStore().list()
+            if not sessions:
+                print_imessage("ChatGPT", "No saved sessions.", is_user=False)
+            for name, entry in sessions[:20]:
+                updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["updated"]))
+                print_imessage("ChatGPT", f"{name}: {entry['messages']} messages, {updated}. {entry['title']}", is_user=False)
+            continue
+
+        if user_input.lower() == "save" or user_input.lower().startswith("save="):
+            name = user_input.split("=", 1)[1].strip() if "=" in user_input else time.strftime("session-%Y%m%d-%H%M%S")
+            store = SessionStore()
+            if conversation_history.session:
+                print_imessage("ChatGPT", f"This conversation is already being saved as '{conversation_history.session.name}'.", is_user=False)
+            elif not SESSION_NAME.match(name):
+                print_imessage("ChatGPT", "Session names may only use letters, digits, '.', '-' and '_'.", is_user=False)
+            elif store.exists(name):
+                print_imessage("ChatGPT", f"A session named '{name}' already exists; use 'load={name}' to resume it.", is_user=False)
+            else:
+                session = store.open(name)
+                # The summary of older turns, if any, then the window
+                for message in conversation_history.payload():
+                    session.append(message["role"], message["content"])
+                conversation_history.session = session
+                print_imessage("ChatGPT", f"Saving this conversation as '{name}'.", is_user=False)
+            continue
+
+        if user_input.lower() == "load" or user_input.lower().startswith("load="):
+            store = SessionStore()
+            sessions = store.list()
+            name = user_input.split("=", 1)[1].strip() if "=" in user_input else (sessions[0][0] if sessions else "")
+            if not name or not SESSION_NAME.match(name) or not store.exists(name):
+                print_imessage("ChatGPT", f"No saved session named '{name}'. Type 'sessions' to list them.", is_user=False)
+                continue
+            start = time.perf_counter()
+            messages = store.tail(name, int(conversation_history.budget * LOW_WATER))
+            if messages is None:
+                print_imessage("ChatGPT", f"No saved session named '{name}'. Type 'sessions' to list them.", is_user=False)
+                continue
+            if conversation_history.session:
+                conversation_history.session.close()
+            conversation_history.clear()
+            for message in messages:
+                conversation_history.append(message["role"], message["content"], log=False)
+            conversation_history.session = store.open(name)
+            last_response = next((m["content"] for m in reversed(messages) if m["role"] == "assistant"), "")
+            print_imessage("ChatGPT", f"Resumed '{name}' with its last {len(messages)} messages "
+                                      f"({(time.perf_counter() - start) * 1000:.1f} ms).", is_user=False)
+            continue
+
+        if user_input.lower() == "detach":
+            if attachments:
+                attachments.close()
+                attachments = None
+            print_imessage("ChatGPT", "Attachments removed.", is_user=False)
+            continue
+
         if user_input.lower() in ["exit", "quit", "bye"]:
             print_imessage("ChatGPT", "Goodbye!", is_user=False)
             break
@@ -143,6 +1144,45 @@ def chat_with_gpt():
             print_imessage("ChatGPT", f"You are currently using the '{current_model}' model.\nAvailable models: {', '.join(available_models)}.", is_user=False)
             continue
 
+        if user_input.lower() == "history":
+            print_imessage("ChatGPT", f"History: {conversation_history.describe()}", is_user=False)
+            continue
+
+        if user_input.lower().startswith("history="):
+            try:
+                budget = int(user_input.split("=", 1)[1])
+                if budget < SUMMARY_TOKENS * 2:
+                    raise ValueError
+            except ValueError:
+                print_imessage("ChatGPT", f"The history budget must be a number of tokens, at least {SUMMARY_TOKENS * 2}.", is_user=False)
+                continue
+            conversation_history.budget = budget
+            print_imessage("ChatGPT", f"History budget set to {budget} tokens.", is_user=False)
+            continue
+
+        if user_input.lower() == "cache":
+            status = cache.describe() if cache else "The response cache is off. Use 'cache=on' to turn it on."
+            print_imessage("ChatGPT", status, is_user=False)
+            continue
+
+        if user_input.lower().startswith("cache="):
+            setting = user_input.split("=", 1)[1].strip().lower()
+            if setting == "on":
+                cache = cache or open_cache("on")
+                if cache:
+                    print_imessage("ChatGPT", f"Response cache on ({cache.path}).", is_user=False)
+            elif setting == "off":
+                if cache:
+                    cache.close()
+                cache = None
+                print_imessage("ChatGPT", "Response cache off.", is_user=False)
+            elif setting == "clear" and cache:
+                cache.clear()
+                print_imessage("ChatGPT", "Response cache cleared.", is_user=False)
+            else:
+                print_imessage("ChatGPT", "Usage: cache=on, cache=off or cache=clear (with the cache on).", is_user=False)
+            continue
+
         if user_input.lower().startswith("output"):
             if not last_response:
                 print_imessage("ChatGPT", "No response available to save.", is_user=False)
@@ -191,33 +1231,201 @@ def chat_with_gpt():
                 print_imessage("ChatGPT", f"File not found: {filepath}", is_user=False)
                 continue
             try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    file_content = f.read()
-                file_message = f"[Attached file: {os.path.basename(filepath)}]\n```\n{file_content}\n```"
-                conversation_history.append({"role": "user", "content": file_message})
-                print_imessage("ChatGPT", f"File '{os.path.basename(filepath)}' attached and sent.", is_user=False)
+                start = time.perf_counter()
+                attachments = attachments or AttachmentIndex()
+                chunks = attachments.add(filepath)
+                print_imessage("ChatGPT", f"File '{os.path.basename(filepath)}' attached ({chunks} chunks indexed in "
+                                          f"{time.perf_counter() - start:.1f}s). Relevant parts will be sent with each question.", is_user=False)
             except Exception as e:
                 print_imessage("ChatGPT", f"Failed to read file '{filepath}': {e}", is_user=False)
             continue
 
-        conversation_history.append({"role": "user", "content": user_input})
+        conversation_history.append("user", user_input)
 
         try:
-            response = openai.ChatCompletion.create(
-                model=current_model,
-                messages=conversation_history,
-                max_tokens=150
-            )
-            chatgpt_reply = response['choices'][0]['message']['content']
-            print_imessage("ChatGPT", chatgpt_reply, is_user=False)
-            last_response = chatgpt_reply
-            conversation_history.append({"role": "assistant", "content": chatgpt_reply})
+            messages = conversation_history.payload()
+            excerpts = attachments.retrieve(user_input) if attachments else []
+            if excerpts:
+                # Sent for this turn only, just before the question
+                messages = messages[:-1] + [excerpts_message(excerpts)] + messages[-1:]
+            start = time.perf_counter()
+            key = cache.key(current_model, messages, {"max_tokens": REPLY_MAX_TOKENS}) if cache else None
+            chatgpt_reply = cache.get(key) if cache else None
+            if chatgpt_reply is not None:
+                print_imessage("ChatGPT", chatgpt_reply, is_user=False,
+                               note=f"cached · {(time.perf_counter() - start) * 1000:.1f} ms")
+            else:
+                chatgpt_reply, _, cancelled = stream_reply(current_model, messages)
+                if cancelled and not chatgpt_reply:
+                    print_imessage("ChatGPT", "Generation cancelled.", is_user=False)
+                # Only complete replies are worth replaying
+                if cache and chatgpt_reply and not cancelled:
+                    cache.put(key, current_model, chatgpt_reply)
+            if chatgpt_reply:
+                # A cancelled reply is kept as far as it got, so the conversation stays consistent
+                last_response = chatgpt_reply
+                conversation_history.append("assistant", chatgpt_reply)
         except Exception as e:
             print_imessage("ChatGPT", f"Error: {e}", is_user=False)
             break
 
+    if cache:
+        cache.close()
+    if conversation_history.session:
+        conversation_history.session.close()
+    if attachments:
+        attachments.close()
+
+# Token bucket for a per-minute allowance (requests or tokens). Waiters are served in order,
+# so a large request isn't starved by small ones
+class RateLimiter:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self._refill()
+            while self.level < amount:
+                await asyncio.sleep((amount - self.level) / self.rate)
+                self._refill()
+            self.level -= amount
+
+    # Correct an estimate once the real cost is known (may leave the bucket in debt)
+    def adjust(self, amount):
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+# Read a batch file: one JSON object per line with "prompt" (or "messages"), and optionally
+# "id", "model" and "max_tokens". Lines without an id are numbered from 1
+def read_batch(path):
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                messages = item.get("messages") or [{"role": "user", "content": item["prompt"]}]
+            except (ValueError, KeyError, AttributeError) as e:
+                print(f"⚠️ Skipping line {number} of {path}: {e!r}")
+                continue
+            jobs.append({"id": item.get("id", number), "messages": messages,
+                         "model": item.get("model"), "max_tokens": item.get("max_tokens")})
+    return jobs
+
+# Rate limits, overload and server errors are worth retrying; bad requests and auth are not
+def is_retryable(e):
+    if isinstance(e, (openai.error.RateLimitError, openai.error.ServiceUnavailableError, openai.error.TryAgain,
+                      openai.error.Timeout, openai.error.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    return isinstance(e, openai.error.APIError) and (e.http_status is None or e.http_status >= 500)
+
+# Seconds to wait before retry number attempt: the server's Retry-After if given, otherwise
+# exponential backoff with full jitter
+def backoff_delay(e, attempt):
+    retry_after = (getattr(e, "headers", None) or {}).get("retry-after")
+    try:
+        return min(BACKOFF_CAP, float(retry_after))
+    except (TypeError, ValueError):
+        return random.uniform(0, min(BACKOFF_CAP, 0.5 * 2 ** attempt))
+
+# Send one batch prompt, retrying as needed; returns its result record
+async def complete_job(job, args, requests_limit, tokens_limit):
+    model = job["model"] or args.model
+    max_tokens = job["max_tokens"] or REPLY_MAX_TOKENS
+    estimate = sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD for m in job["messages"]) + max_tokens
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        if requests_limit:
+            await requests_limit.acquire()
+        if tokens_limit:
+            await tokens_limit.acquire(estimate)
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model=model,
+                messages=job["messages"],
+                max_tokens=max_tokens,
+                request_timeout=args.timeout
+            )
+        except Exception as e:
+            if attempt > args.retries or not is_retryable(e):
+                return {"id": job["id"], "model": model, "error": f"{type(e).__name__}: {e}",
+                        "attempts": attempt, "seconds": round(time.perf_counter() - start, 3)}
+            await asyncio.sleep(backoff_delay(e, attempt))
+            continue
+        usage = response.get("usage") or {}
+        if tokens_limit and usage.get("total_tokens"):
+            tokens_limit.adjust(usage["total_tokens"] - estimate)
+        return {"id": job["id"], "model": model, "reply": response["choices"][0]["message"]["content"],
+                "usage": usage, "attempts": attempt, "seconds": round(time.perf_counter() - start, 3)}
+
+# Take prompts off the queue until it is empty, writing each result as it completes
+async def batch_worker(queue, out, counts, total, args, requests_limit, tokens_limit):
+    while not queue.empty():
+        job = queue.get_nowait()
+        result = await complete_job(job, args, requests_limit, tokens_limit)
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        counts["failed" if "error" in result else "ok"] += 1
+        counts["retries"] += result["attempts"] - 1
+        done = counts["ok"] + counts["failed"]
+        print(f"\r{done}/{total} done, {counts['failed']} failed, {counts['retries']} retries", end="", flush=True)
+
+# Run every prompt of a batch file with at most args.concurrency requests in flight, writing
+# each result to the output file as soon as it completes
+async def run_batch(args):
+    jobs = read_batch(args.batch)
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    requests_limit = RateLimiter(args.rpm) if args.rpm else None
+    tokens_limit = RateLimiter(args.tpm) if args.tpm else None
+    counts = {"ok": 0, "failed": 0, "retries": 0}
+    start = time.perf_counter()
+
+    # One connection pool for the whole batch instead of a new one per request
+    async with aiohttp.ClientSession() as session:
+        openai.aiosession.set(session)
+        with open(args.output, "w", encoding="utf-8") as out:
+            await asyncio.gather(*(batch_worker(queue, out, counts, len(jobs), args, requests_limit, tokens_limit)
+                                   for _ in range(max(1, args.concurrency))))
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(jobs)} prompts in {elapsed:.1f}s ({len(jobs) / elapsed if elapsed else 0:.1f}/s); results in {args.output}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Chat with ChatGPT, or send a file of prompts concurrently.")
+    parser.add_argument("--batch", metavar="FILE", help="JSONL file of prompts to send instead of chatting.")
+    parser.add_argument("--output", default="batch-results.jsonl", help="JSONL results file for --batch.")
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="Model for prompts that don't name one.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once.")
+    parser.add_argument("--rpm", type=int, default=500, help="Requests per minute (0 for no limit).")
+    parser.add_argument("--tpm", type=int, default=90000, help="Tokens per minute (0 for no limit).")
+    parser.add_argument("--retries", type=int, default=BATCH_RETRIES, help="Retries on 429 and 5xx errors.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds before a request is abandoned.")
+    return parser.parse_args()
+
+# Set OPENAI_API_BASE (e.g. http://127.0.0.1:8000/v1) to talk to a local server speaking the
+# chat-completions API, such as a streaming stub for testing
 if __name__ == "__main__":
+    args = parse_arguments()
+    openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
+    openai.requestssession = make_session()
     openai.api_key = get_api_key()
-    if openai.api_key:
+    if openai.api_key and args.batch:
+        asyncio.run(run_batch(args))
+    elif openai.api_key:
         chat_with_gpt()
 
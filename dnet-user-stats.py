@@ -1,16 +1,26 @@
 #!/usr/bin/python3
-# Description: A command-line interface to https://stats.distributed.net 
-# Usage: python3 dnet-user-stats.py -p <project> -u <username>
+# Description: A command-line interface to https://stats.distributed.net
+# Usage: python3 dnet-user-stats.py -p <project> [<project> ...] -u <username> [<username> ...]
+#        python3 dnet-user-stats.py -p RC5-72 OGR-28 -f team.txt [--format table|csv|json] [--workers 8]
+#        python3 dnet-user-stats.py -p RC5-72 -u <username> --history 30 | --watch [--window 7]
+#        python3 dnet-user-stats.py -p RC5-72 --crawl 10000 [--workers 8] [--retries 4]
+#        python3 dnet-user-stats.py -p RC5-72 -f team.txt --overall-only   (answered from the crawled leaderboard)
+#        Stats are cached in ~/.dnet-stats.db until the next daily update; --refresh fetches anyway
 # Author: Justin Oros
 # Source: https://github.com/JustinOros
-# Dependencies: pip install requests argparse beautifulsoup4 lxml
+# Dependencies: pip install requests argparse lxml
 
-from bs4 import BeautifulSoup
-import requests, argparse, sys
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import requests, argparse, sys, csv, json, time, random
+import dnet_parse, dnet_cache, dnet_history, dnet_leaderboard, sqlite3
 
 # Distributed.net Participant Search Form
 searchUrl = 'https://stats.distributed.net/participant/psearch.php'
 
+# Distributed.net Participant Listing (by overall rank, one page at a time)
+listUrl = 'https://stats.distributed.net/participant/plist.php'
+
 # Distributed.net Projects (and associated IDs)
 validProjects = {
     'RC5-56': 3,
@@ -23,83 +33,290 @@ validProjects = {
     'OGR-28': 28,
 }
 
+# Columns of the table, CSV and JSON output
+fields = ['user', 'project', 'rank', 'overall', 'updated', 'error']
+historyFields = ['user', 'project', 'day', 'rank', 'change', 'overall', 'average']
+
+# Watch mode sleeps until the cached stats expire (the next daily update), at least minPoll
+# seconds, plus up to pollJitter seconds so many watchers don't all hit the site at once
+minPoll = 60
+pollJitter = 300
+
+# One HTTP session whose connection pool can serve every worker at once
+def make_session(workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# A result row; stats is a ParticipantStats, or None with error set (or 'not found')
+def make_result(user, project, stats, error=''):
+    result = {'user': user, 'project': project, 'project_name': project,
+              'rank': None, 'overall': None, 'updated': None, 'error': error}
+    if stats is not None:
+        result.update(stats.as_dict())
+    elif not error:
+        result['error'] = 'not found'
+    return result
+
+# Look up one user in one project on the site: (stats or None if not found, error message or '')
+def fetch_stats(session, user, project):
+    # Prepare data for the request
+    data = {'project_id': validProjects[project], 'st': user}
+
+    try:
+        response = session.post(searchUrl, data=data, timeout=dnet_leaderboard.TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        return None, f'fetch failed: {e}'
+    return dnet_parse.parse_participant(response.content), ''
+
+# Answer every (user, project) lookup: from the cache while it is fresh (unless refresh), then,
+# when a board is given, from its fresh crawled leaderboard, and otherwise concurrently from the
+# site, at most `workers` at a time. The leaderboard only knows overall ranks, so callers pass
+# a board only when the current rank isn't needed. Results come back in the order of the users,
+# then the projects
+def lookup_all(users, projects, workers=8, cache=None, refresh=False, board=None):
+    pairs = [(user, project) for user in users for project in projects]
+    results = [None] * len(pairs)
+    pending = []
+    for i, (user, project) in enumerate(pairs):
+        fresh, stats = cache.get(validProjects[project], user) if cache and not refresh else (False, None)
+        entry = board.lookup(validProjects[project], user) if board and not fresh and not refresh else None
+        if fresh:
+            results[i] = make_result(user, project, stats)
+        elif entry:
+            overall, _, _, updated = entry
+            results[i] = make_result(user, project, dnet_parse.ParticipantStats(project, None, overall, updated))
+        else:
+            pending.append(i)
+    if not pending:
+        return results
+
+    workers = max(1, min(workers, len(pending)))
+    session = make_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fetched = executor.map(lambda i: fetch_stats(session, *pairs[i]), pending)
+        for i, (stats, error) in zip(pending, fetched):
+            user, project = pairs[i]
+            results[i] = make_result(user, project, stats, error)
+            if cache and not error:  # failures are never cached
+                cache.put(validProjects[project], user, stats)
+    return results
+
+# Mirror the top `top` participants of each project, reporting per project
+def crawl_all(projects, top, workers, retries, board):
+    session = make_session(workers)
+    for project in projects:
+        start = time.perf_counter()
+        try:
+            fetched, resumed, failed, stored = dnet_leaderboard.crawl(
+                session, listUrl, board, validProjects[project], top, workers, retries,
+                report=lambda message: print(f'{project}: {message}', file=sys.stderr))
+        except requests.RequestException as e:
+            print(f'{project}: crawl failed: {e}', file=sys.stderr)
+            continue
+        if not fetched and not failed:
+            print(f'{project}: top {top:,} already up to date')
+            continue
+        print(f'{project}: {stored:,} participants from {fetched:,} pages in {time.perf_counter() - start:.1f}s'
+              + (f', {resumed:,} pages resumed' if resumed else '')
+              + (f', {failed:,} pages failed (run again to resume)' if failed else ''))
+
+def format_rank(rank):
+    return f'{rank:,}' if rank is not None else '-'
+
+def format_date(updated):
+    return updated.strftime('%b %d, %Y') if updated else ''
+
+# The original single-lookup output
+def print_text(result):
+    if result['error'] == 'not found':
+        print(f"\nError: {result['user']} not found for project {result['project']}.\n")  # Notify if user not found
+        return
+    if result['error']:
+        print(f"An error has occurred while fetching data ({result['error']}).")
+        return
+    print(f"\nUser: {result['user']}")
+    print(f"Project: {result['project_name']}")
+    print(f"Rank: {format_rank(result['rank'])}")
+    print(f"Overall: {format_rank(result['overall'])}")
+    print(f"Updated: {format_date(result['updated'])}\n")
+
+# Left-aligned text and right-aligned numbers under a header row
+def print_columns(headers, rows, right):
+    widths = [max(len(str(row[i])) for row in rows + [headers]) for i in range(len(headers))]
+    for row in [headers, ['-' * w for w in widths]] + rows:
+        print('  '.join(str(cell).rjust(w) if i in right else str(cell).ljust(w)
+                        for i, (cell, w) in enumerate(zip(row, widths))).rstrip())
+
+def print_table(results):
+    headers = ['User', 'Project', 'Rank', 'Overall', 'Updated']
+    rows = [[r['user'], r['project'], format_rank(r['rank']), format_rank(r['overall']), r['error'] or format_date(r['updated'])]
+            for r in results]
+    print_columns(headers, rows, {2, 3})
+
+# Machine-readable rows: ISO dates, empty when unknown
+def export_rows(rows, columns):
+    return [{k: (r[k].isoformat() if r[k] else '') if k in ('updated', 'day') else r[k] for k in columns} for r in rows]
+
+def write_csv(rows, columns=fields):
+    writer = csv.DictWriter(sys.stdout, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(export_rows(rows, columns))
+
+def write_json(rows, columns=fields):
+    print(json.dumps(export_rows(rows, columns), indent=2))
+
+def format_change(change):
+    return f'{change:+,}' if change else '='
+
+def format_average(average):
+    return f'{average:,.1f}' if average is not None else '-'
+
+# Add every found result to the rank history; returns the ones whose stats date was new. Answers
+# from the leaderboard carry no current rank and are left out, so they never shadow a full lookup
+def record_history(history, results):
+    return [r for r in results if not r['error'] and r['updated'] and r['rank'] is not None and
+            history.record(validProjects[r['project']], r['user'], r['updated'], r['rank'], r['overall'])]
+
+# One user's rank change and moving average on their newest stored day
+def describe_trend(history, result, window):
+    points = history.trend(validProjects[result['project']], result['user'], 1, window)
+    if not points:
+        return f"{result['user']} {result['project']}: no history yet"
+    point = points[-1]
+    return (f"{point.day} {result['user']} {result['project']}: rank {format_rank(point.rank)} ({format_change(point.change)}), "
+            f"overall {format_rank(point.overall)}, {window}-day average {format_average(point.average)}")
+
+# The stored series of every user and project over the last `days` days
+def print_history(history, users, projects, days, window, outputFormat):
+    rows = [{'user': user, 'project': project, **point.as_dict()}
+            for user in users for project in projects
+            for point in history.trend(validProjects[project], user, days, window)]
+    if outputFormat == 'csv':
+        write_csv(rows, historyFields)
+    elif outputFormat == 'json':
+        write_json(rows, historyFields)
+    elif not rows:
+        print('No history stored yet for these users and projects.')
+    else:
+        headers = ['User', 'Project', 'Date', 'Rank', 'Change', 'Overall', f'{window}-day avg']
+        print_columns(headers, [[r['user'], r['project'], r['day'].isoformat(), format_rank(r['rank']), format_change(r['change']),
+                                 format_rank(r['overall']), format_average(r['average'])] for r in rows], {3, 4, 5, 6})
+
+# Poll until interrupted, but only once the cached stats are due to be replaced; report each
+# user's standing on start, then every new day's rank change and moving average
+def watch(users, projects, workers, cache, history, window):
+    keys = [(validProjects[project], user) for user in users for project in projects]
+    first = True
+    while True:
+        results = lookup_all(users, projects, workers, cache)
+        fresh = {id(result) for result in record_history(history, results)}
+        for result in results:
+            if result['error'] and result['error'] != 'not found':
+                print(f"{result['user']} {result['project']}: {result['error']}", file=sys.stderr)
+            elif first or id(result) in fresh:
+                print(describe_trend(history, result, window) if not result['error'] else
+                      f"{result['user']} {result['project']}: not found", flush=True)
+        first = False
+        time.sleep(max(minPoll, cache.next_expiry(keys) - time.time()) + random.uniform(0, pollJitter))
+
+# Usernames from a file, one per line; blank lines and # comments are skipped
+def read_users(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
 # Parse command-line arguments
 def parse_arguments():
-    parser = argparse.ArgumentParser(description='Fetch Distributed.net stats for user and project.')
-    parser.add_argument('-u', '--user', type=str, required=True, help='Username of the participant.')
-    parser.add_argument('-p', '--project', type=str, required=True, choices=validProjects.keys())
+    parser = argparse.ArgumentParser(description='Fetch Distributed.net stats for users and projects.')
+    parser.add_argument('-u', '--user', type=str, action='extend', nargs='+', default=[],
+                        help='Username(s) of the participant(s).')
+    parser.add_argument('-f', '--users-file', metavar='FILE', help='File with one username per line.')
+    parser.add_argument('-p', '--project', type=str, action='extend', nargs='+', required=True,
+                        choices=validProjects.keys())
+    parser.add_argument('-o', '--format', choices=['text', 'table', 'csv', 'json'],
+                        help='Output format (default: text for one lookup, table for several).')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='Lookups to run at once.')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached stats and fetch everything again.')
+    parser.add_argument('--no-cache', action='store_true', help='Neither read nor write the local stats database.')
+    parser.add_argument('--db', default=dnet_cache.DB_FILE, help='Local stats cache and rank history (default: %(default)s).')
+    parser.add_argument('--history', type=int, metavar='DAYS', help='Show the stored rank history of the last DAYS days.')
+    parser.add_argument('--watch', action='store_true', help='Keep running and report each daily rank change.')
+    parser.add_argument('--window', type=int, default=dnet_history.WINDOW, help='Days in the moving average.')
+    parser.add_argument('--crawl', type=int, metavar='N', help='Mirror the top N participants of each project locally.')
+    parser.add_argument('--retries', type=int, default=dnet_leaderboard.RETRIES, help='Retries per leaderboard page.')
+    parser.add_argument('--overall-only', action='store_true',
+                        help='Only overall ranks are needed: answer from a crawled leaderboard where possible.')
     args = parser.parse_args()
 
-    return parser.parse_args()
+    if args.users_file:
+        try:
+            args.user += read_users(args.users_file)
+        except OSError as e:
+            parser.error(f'cannot read {args.users_file}: {e}')
+    if not args.user and not args.crawl:
+        parser.error('give at least one user with -u or -f')
+    if args.no_cache and (args.watch or args.history or args.crawl):
+        parser.error('--watch, --history and --crawl need the local stats database')
+
+    # Drop repeats but keep the order given
+    args.user = list(dict.fromkeys(args.user))
+    args.project = list(dict.fromkeys(args.project))
+    return args
 
 # Main execution function
 def main():
     # Parse the command-line arguments
     args = parse_arguments()
 
-    # Retrieve user and project from parsed arguments
-    user = args.user
-    project = args.project
-
-    # Get project ID
-    projectId = validProjects[project]
-
-    # Prepare data for the request
-    data = {'project_id': projectId, 'st': user}
+    # Stats change once a day, so repeat lookups are answered locally until the next update,
+    # and every day seen is kept in the rank history
+    cache = history = board = None
+    if not args.no_cache:
+        try:
+            cache = dnet_cache.StatsCache(args.db)
+            history = dnet_history.RankHistory(args.db)
+            board = dnet_leaderboard.Leaderboard(args.db)
+        except sqlite3.Error as e:
+            if args.watch or args.history or args.crawl:
+                sys.exit(f'Cannot open the stats database {args.db}: {e}')
+            print(f'Not using the stats cache {args.db}: {e}', file=sys.stderr)
+            cache = history = board = None
 
-    # Perform a POST request to fetch the response
-    response = requests.post(searchUrl, data=data)
-
-    if response:  # Proceed if we received a response
-        soup = BeautifulSoup(response.text, 'lxml')  # Load the response into BeautifulSoup
-
-        summary = soup.find('td', class_='htitle').text.lstrip()  # Find summary
-
-        if 'Summary' in summary:
-            print(f'\nUser: {user}')  # Print user
-            summary = ' '.join(summary.split())  # Remove extra spaces from summary
-            summary = summary.split('/')  # Split summary and project into 2 strings
-            project_name = summary[0]  # Store the project name from the summary into a variable
-            print(f'Project: {project_name}')  # Print project
-        else:
-            print(f'\nError: {user} not found for project {project}.\n')  # Notify if user not found
-            sys.exit()
-
-        line = 0
-        for match in soup.find_all('td', align='right'):  # Search soup for table data
-            line += 1
-            if line == 1:  # Get overall rank
-                overallRank = match.text.lstrip()
-                if overallRank[0] != 'T' and overallRank[0] != '0':
-                    overallRank = overallRank.split('(')
-                    overallRank = overallRank[0]
-            if line == 2:  # Get current rank
-                currentRank = match.text.lstrip()
-                if currentRank[0] != '0':
-                    currentRank = currentRank.split('(')
-                    currentRank = currentRank[0]
-            if line == 3:  # Print current and overall rank
-                currentRank = f'{int(currentRank):,}'
-                print(f'Rank: {currentRank}')
-                overallRank = f'{int(overallRank):,}'
-                print(f'Overall: {overallRank}')
-                break
-
-        # Grab the date an update to rank was posted
-        lastUpdate = soup.find('td', class_='lastupdate').text.split()
-        lastUpdate = lastUpdate[8].lstrip()
-
-        # Format the date
-        Year = lastUpdate[7:12]
-        Month = lastUpdate[3:6]
-        Day = lastUpdate[0:2]
-
-        formattedDate = f'{Month} {Day}, {Year}'
-
-        print(f'Updated: {formattedDate}\n')
+    try:
+        if args.crawl:
+            crawl_all(args.project, args.crawl, args.workers, args.retries, board)
+            if not args.user:
+                return
+        if args.history:
+            print_history(history, args.user, args.project, args.history, args.window, args.format)
+            return
+        if args.watch:
+            watch(args.user, args.project, args.workers, cache, history, args.window)
+            return
+        results = lookup_all(args.user, args.project, args.workers, cache, args.refresh,
+                             board if args.overall_only else None)
+        if history:
+            record_history(history, results)
+    except KeyboardInterrupt:
+        return
+    finally:
+        for store in (cache, history, board):
+            if store:
+                store.close()
 
+    outputFormat = args.format or ('text' if len(results) == 1 else 'table')
+    if outputFormat == 'text':
+        for result in results:
+            print_text(result)
+    elif outputFormat == 'table':
+        print_table(results)
+    elif outputFormat == 'csv':
+        write_csv(results)
     else:
-        print('An error has occurred while fetching data.')
+        write_json(results)
 
 if __name__ == '__main__':
     main()
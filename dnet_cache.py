@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# Description: Local SQLite cache of distributed.net participant stats that stays valid until the next daily stats run.
+# Usage: import dnet_cache; cache = dnet_cache.StatsCache(); stats = cache.get(8, "bovine"); cache.put(8, "bovine", stats)
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import os
+import time
+import sqlite3
+from datetime import date, datetime, time as clock, timedelta, timezone
+import dnet_parse
+
+# Shared by every run (cron jobs included), whatever the working directory
+DB_FILE = os.path.expanduser(os.getenv("DNET_STATS_DB", "~/.dnet-stats.db"))
+
+# The stats are rebuilt once a day. A page dated D is served from the cache until D + 1 (UTC);
+# past that, if the site still shows D, check again at most this often until the new run lands
+RECHECK = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS participants (
+    project_id   INTEGER NOT NULL,
+    user         TEXT NOT NULL COLLATE NOCASE,
+    found        INTEGER NOT NULL,
+    project_name TEXT,
+    rank         INTEGER,
+    overall      INTEGER,
+    updated      TEXT,
+    checked      REAL NOT NULL,
+    expires      REAL NOT NULL,
+    PRIMARY KEY (project_id, user)
+) WITHOUT ROWID;
+"""
+
+def connect(db_path=DB_FILE):
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+# When stats dated `updated` (today's UTC date if unknown, e.g. a search that found nobody) are
+# expected to be replaced, as a Unix time
+def expires_at(updated, now):
+    day = updated or datetime.fromtimestamp(now, timezone.utc).date()
+    next_run = datetime.combine(day + timedelta(days=1), clock(), timezone.utc).timestamp()
+    return max(next_run, now + RECHECK)
+
+# Participant lookups keyed by (project id, user); users match case-insensitively like the site's search
+class StatsCache:
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.db = connect(path)
+        self.hits = 0
+        self.misses = 0
+
+    # (True, ParticipantStats or None if the user was not found) while fresh, else (False, None)
+    def get(self, project_id, user, now=None):
+        now = time.time() if now is None else now
+        row = self.db.execute("SELECT found, project_name, rank, overall, updated FROM participants "
+                              "WHERE project_id = ? AND user = ? AND expires > ?", (project_id, user, now)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        found, project_name, rank, overall, updated = row
+        if not found:
+            return True, None
+        return True, dnet_parse.ParticipantStats(project_name, rank, overall, date.fromisoformat(updated) if updated else None)
+
+    # Store a fresh lookup: stats is a ParticipantStats, or None when the search found nobody
+    def put(self, project_id, user, stats, now=None):
+        now = time.time() if now is None else now
+        updated = stats.updated if stats else None
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO participants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (project_id, user, stats is not None,
+                             stats.project_name if stats else None, stats.rank if stats else None,
+                             stats.overall if stats else None, updated.isoformat() if updated else None,
+                             now, expires_at(updated, now)))
+
+    # When the first of the given (project id, user) entries goes stale; now if any is missing
+    def next_expiry(self, keys, now=None):
+        now = time.time() if now is None else now
+        expiry = float("inf")
+        for project_id, user in keys:
+            row = self.db.execute("SELECT expires FROM participants WHERE project_id = ? AND user = ?",
+                                  (project_id, user)).fetchone()
+            expiry = min(expiry, row[0] if row else now)
+        return expiry
+
+    def close(self):
+        self.db.close()
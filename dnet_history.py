@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+# Description: Daily rank history of distributed.net participants in SQLite, with rank changes and moving averages.
+# Usage: import dnet_history; h = dnet_history.RankHistory(); h.record(8, "bovine", day, 145, 5145); h.trend(8, "bovine")
+#        python3 dnet_history.py --benchmark [--users N] [--years N]
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import os
+import time
+import random
+import argparse
+import tempfile
+from collections import deque
+from datetime import date, timedelta
+import dnet_cache
+
+# One row per participant, project and stats date. The primary key is the table's own order
+# (WITHOUT ROWID), so one participant's series is a single contiguous range scan however many
+# participants and years are stored; history_day serves whole-project queries for one date
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    project_id INTEGER NOT NULL,
+    user       TEXT NOT NULL COLLATE NOCASE,
+    day        TEXT NOT NULL,
+    rank       INTEGER,
+    overall    INTEGER,
+    PRIMARY KEY (project_id, user, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_day ON history (project_id, day);
+"""
+
+# Days averaged for the moving average
+WINDOW = 7
+
+# One day of a trend: rank change is the climb since the previous stored day (positive is better)
+class Point:
+    __slots__ = ("day", "rank", "overall", "change", "average")
+
+    def __init__(self, day, rank, overall, change, average):
+        self.day = day
+        self.rank = rank
+        self.overall = overall
+        self.change = change
+        self.average = average  # mean rank over the window ending on this day, or None
+
+    def as_dict(self):
+        return {"day": self.day, "rank": self.rank, "overall": self.overall, "change": self.change, "average": self.average}
+
+# Ranks seen per (project id, user) and stats date; kept in the same database as the stats cache
+class RankHistory:
+    def __init__(self, path=dnet_cache.DB_FILE):
+        self.path = path
+        self.db = dnet_cache.connect(path)
+        self.db.executescript(SCHEMA)
+
+    # Store one day's ranks; the site only changes daily, so a date already stored is left
+    # alone. True if the day was new
+    def record(self, project_id, user, day, rank, overall):
+        with self.db:
+            cursor = self.db.execute("INSERT OR IGNORE INTO history VALUES (?, ?, ?, ?, ?)",
+                                     (project_id, user, day.isoformat(), rank, overall))
+        return cursor.rowcount == 1
+
+    # [(date, rank, overall), ...] oldest first, optionally only from `since` on
+    def series(self, project_id, user, since=None):
+        rows = self.db.execute("SELECT day, rank, overall FROM history WHERE project_id = ? AND user = ? AND day >= ? "
+                               "ORDER BY day", (project_id, user, since.isoformat() if since else ""))
+        return [(date.fromisoformat(day), rank, overall) for day, rank, overall in rows]
+
+    # Points for the last `days` days up to the newest stored day (None for all of them); rows from
+    # before the range are read only to seed the first change and average
+    def trend(self, project_id, user, days=None, window=WINDOW):
+        newest = self.db.execute("SELECT MAX(day) FROM history WHERE project_id = ? AND user = ?",
+                                 (project_id, user)).fetchone()[0]
+        if newest is None:
+            return []
+        first = date.fromisoformat(newest) - timedelta(days=days - 1) if days else None
+        rows = self.series(project_id, user, first - timedelta(days=window) if first else None)
+
+        points = []
+        recent = deque()  # (day, rank) inside the moving-average window
+        previous = None
+        for day, rank, overall in rows:
+            if rank is not None:
+                recent.append((day, rank))
+            while recent and recent[0][0] <= day - timedelta(days=window):
+                recent.popleft()
+            change = previous - rank if previous is not None and rank is not None else None
+            average = sum(r for _, r in recent) / len(recent) if recent else None
+            if first is None or day >= first:
+                points.append(Point(day, rank, overall, change, average))
+            if rank is not None:
+                previous = rank
+        return points
+
+    def close(self):
+        self.db.close()
+
+# Time trend queries over a synthetic history of `users` participants with a rank every day for `years` years
+def benchmark(users=500, years=5, queries=200):
+    rng = random.Random(1)
+    days = int(years * 365.25)
+    start = date.today() - timedelta(days=days)
+    with tempfile.TemporaryDirectory() as tmp:
+        history = RankHistory(os.path.join(tmp, "history.db"))
+        begin = time.perf_counter()
+        with history.db:
+            for n in range(users):
+                rank = rng.randint(1, 100000)
+                rows = []
+                for d in range(days):
+                    rank = max(1, rank + rng.randint(-20, 20))
+                    rows.append((8, f"user{n}@example.com", (start + timedelta(days=d)).isoformat(), rank, rank * 3))
+                history.db.executemany("INSERT OR IGNORE INTO history VALUES (?, ?, ?, ?, ?)", rows)
+        print(f"Stored {users * days:,} days of history in {time.perf_counter() - begin:.1f}s")
+
+        for label, span in (("last 30 days", 30), ("last year", 365), ("everything", None)):
+            begin = time.perf_counter()
+            for _ in range(queries):
+                history.trend(8, f"user{rng.randrange(users)}@example.com", span)
+            print(f"{label:<14}{(time.perf_counter() - begin) / queries * 1000:>8.2f} ms per participant")
+        history.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the distributed.net rank history.")
+    parser.add_argument("--benchmark", action="store_true", help="Time trend queries over a synthetic history.")
+    parser.add_argument("--users", type=int, default=500, help="Participants in the synthetic history.")
+    parser.add_argument("--years", type=float, default=5, help="Years of daily ranks per participant.")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.users, args.years)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+# Description: Concurrent, resumable crawl of a distributed.net project's participant listing into a local indexed table.
+# Usage: import dnet_leaderboard; board = dnet_leaderboard.Leaderboard(); dnet_leaderboard.crawl(session, url, board, 8, 10000)
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import time
+import random
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+import dnet_cache
+import dnet_parse
+
+# Participants per listing page (plist.php's limit)
+PAGE_SIZE = 100
+
+# Attempts per page after the first, and the backoff cap in seconds
+RETRIES = 4
+BACKOFF_CAP = 30.0
+
+# Seconds to wait for the stats server (connect, read), for searches as well as listing pages
+TIMEOUT = (5, 30)
+
+# The listing as of one stats date. Lookups by name and top-N reads each use their own index;
+# crawl_pages is the checkpoint: a page is recorded in the same transaction as its rows, so an
+# interrupted crawl resumes at exactly the pages that never landed
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leaderboard (
+    project_id     INTEGER NOT NULL,
+    participant_id INTEGER NOT NULL,
+    rank           INTEGER NOT NULL,
+    name           TEXT NOT NULL COLLATE NOCASE,
+    change         INTEGER,
+    updated        TEXT,
+    expires        REAL NOT NULL,
+    PRIMARY KEY (project_id, participant_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS leaderboard_name ON leaderboard (project_id, name, rank);
+CREATE INDEX IF NOT EXISTS leaderboard_rank ON leaderboard (project_id, rank);
+CREATE TABLE IF NOT EXISTS crawl_pages (
+    project_id INTEGER NOT NULL,
+    low        INTEGER NOT NULL,
+    updated    TEXT,
+    rows       INTEGER NOT NULL,
+    expires    REAL NOT NULL,
+    PRIMARY KEY (project_id, low)
+) WITHOUT ROWID;
+"""
+
+# Mirrored listings, kept in the same database as the stats cache
+class Leaderboard:
+    def __init__(self, path=dnet_cache.DB_FILE):
+        self.path = path
+        self.db = dnet_cache.connect(path)
+        self.db.executescript(SCHEMA)
+
+    # {low: stats date} of the pages already stored for a project
+    def checkpoint(self, project_id):
+        return {low: updated for low, updated in
+                self.db.execute("SELECT low, updated FROM crawl_pages WHERE project_id = ?", (project_id,))}
+
+    # True while every page up to `top` is stored and not yet due for the next update
+    def is_fresh(self, project_id, top, now=None):
+        now = time.time() if now is None else now
+        fresh = self.db.execute("SELECT COUNT(*) FROM crawl_pages WHERE project_id = ? AND low <= ? AND expires > ?",
+                                (project_id, top, now)).fetchone()[0]
+        return fresh >= len(range(1, top + 1, PAGE_SIZE))
+
+    # Forget a project's listing, e.g. once the site has moved on to a newer stats date
+    def reset(self, project_id):
+        with self.db:
+            self.db.execute("DELETE FROM leaderboard WHERE project_id = ?", (project_id,))
+            self.db.execute("DELETE FROM crawl_pages WHERE project_id = ?", (project_id,))
+
+    # Store one page's rows and mark the page done, atomically
+    def store_page(self, project_id, low, updated, rows, now=None):
+        now = time.time() if now is None else now
+        day = updated.isoformat() if updated else None
+        expires = dnet_cache.expires_at(updated, now)
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO leaderboard VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [(project_id, participant_id, rank, name, change, day, expires)
+                                 for rank, participant_id, name, change in rows])
+            self.db.execute("INSERT OR REPLACE INTO crawl_pages VALUES (?, ?, ?, ?, ?)",
+                            (project_id, low, day, len(rows), expires))
+
+    # A participant's listing entry while it is fresh: (rank, name, rank change, stats date), else None
+    def lookup(self, project_id, name, now=None):
+        now = time.time() if now is None else now
+        row = self.db.execute("SELECT rank, name, change, updated FROM leaderboard WHERE project_id = ? AND name = ? "
+                              "AND expires > ? ORDER BY rank LIMIT 1", (project_id, name, now)).fetchone()
+        if row is None:
+            return None
+        rank, name, change, updated = row
+        return rank, name, change, date.fromisoformat(updated) if updated else None
+
+    # The first n entries: [(rank, name, rank change), ...]
+    def top(self, project_id, n):
+        return self.db.execute("SELECT rank, name, change FROM leaderboard WHERE project_id = ? ORDER BY rank LIMIT ?",
+                               (project_id, n)).fetchall()
+
+    def close(self):
+        self.db.close()
+
+# A page is worth asking for again after a timeout or dropped connection (no response at all),
+# while plist.php is rate limiting us, or when the stats server itself fails
+def is_retryable(e):
+    response = getattr(e, "response", None)
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+# Pause before asking for a page again. Honour Retry-After when the site sends one; otherwise
+# pick a random wait below 0.5s * 2^attempt, so the crawl's workers don't all come back at once
+def backoff_delay(e, attempt):
+    response = getattr(e, "response", None)
+    try:
+        return min(BACKOFF_CAP, float(response.headers["Retry-After"]))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return random.uniform(0, min(BACKOFF_CAP, 0.5 * 2 ** attempt))
+
+# One listing page, parsed, retrying timeouts, connection errors, 429s and 5xx responses
+def fetch_page(session, url, project_id, low, retries=RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, params={"project_id": project_id, "low": low, "limit": PAGE_SIZE}, timeout=TIMEOUT)
+            response.raise_for_status()
+            return dnet_parse.parse_leaderboard(response.content)
+        except requests.RequestException as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            time.sleep(backoff_delay(e, attempt))
+
+# Mirror the top `top` of a project's listing into the board, `workers` pages at a time. Pages
+# already stored for the site's current stats date are skipped, and each page is written as
+# soon as it arrives. Returns (pages fetched, pages resumed, pages failed, rows stored)
+def crawl(session, url, board, project_id, top, workers=8, retries=RETRIES, report=print):
+    lows = list(range(1, top + 1, PAGE_SIZE))
+    if board.is_fresh(project_id, top):
+        return 0, len(lows), 0, 0
+
+    # The first page tells which stats date the site is on; a checkpoint from another date is stale
+    updated, rows = fetch_page(session, url, project_id, lows[0], retries)
+    done = board.checkpoint(project_id)
+    if any(day != (updated.isoformat() if updated else None) for day in done.values()):
+        board.reset(project_id)
+        done = {}
+    board.store_page(project_id, lows[0], updated, rows)
+    fetched, stored, failed = 1, len(rows), 0
+    pending = [low for low in lows[1:] if low not in done]
+    resumed = len(lows) - 1 - len(pending)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(fetch_page, session, url, project_id, low, retries): low for low in pending}
+        try:
+            for future in as_completed(futures):
+                low = futures[future]
+                try:
+                    page_updated, rows = future.result()
+                except requests.RequestException as e:
+                    failed += 1
+                    report(f"Page {low:,}-{low + PAGE_SIZE - 1:,} failed: {e}")
+                    continue
+                if page_updated != updated:
+                    failed += 1
+                    report(f"Page {low:,}-{low + PAGE_SIZE - 1:,} is from {page_updated}, not {updated}; the stats were updated mid-crawl")
+                    continue
+                board.store_page(project_id, low, page_updated, rows)
+                fetched += 1
+                stored += len(rows)
+        except KeyboardInterrupt:
+            # Stored pages stay checkpointed; drop the queued ones so the next run resumes from here
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return fetched, resumed, failed, stored
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+# Description: Targeted lxml parser for stats.distributed.net participant pages, with a benchmark against BeautifulSoup.
+# Usage: import dnet_parse; stats = dnet_parse.parse_participant(response.content)
+#        python3 dnet_parse.py [--benchmark] [--rounds N] [fixture.html ...]
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+# Dependencies: pip install lxml beautifulsoup4
+
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+import tracemalloc
+import multiprocessing
+from datetime import datetime
+from lxml import etree
+
+# Synthetic pages for the benchmark: hand-built to the site's layout (not captures), with
+# example.net names and one consistent set of stats across the summary and listing pages
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dnet-fixtures")
+
+# Compiled once: the summary title, the first two right-aligned cells (overall rank, then
+# current rank) and the last-update banner, each pulled straight out of the tree
+TITLE = etree.XPath("normalize-space((//td[contains(concat(' ', normalize-space(@class), ' '), ' htitle ')])[1])")
+RANKS = etree.XPath("(//td[@align='right'])[position() <= 2]")
+UPDATED = etree.XPath("string((//td[contains(concat(' ', normalize-space(@class), ' '), ' lastupdate ')])[1])")
+CELL_TEXT = etree.XPath("normalize-space(.)")
+
+# Participant listing (plist.php): every row linking to a participant summary, and in it the
+# rank cell and the link
+LIST_ROWS = etree.XPath("//tr[td//a[contains(@href, 'psummary.php')]]")
+LIST_RANK = etree.XPath("normalize-space(td[1])")
+LIST_LINK = etree.XPath("(td//a[contains(@href, 'psummary.php')])[1]")
+
+# Ranks look like "5,145 (+3)"; dates like 17-Oct-2026
+RANK_PATTERN = re.compile(r"^\s*([\d,]+)")
+DATE_PATTERN = re.compile(r"\b(\d{1,2}-[A-Za-z]{3}-\d{4})\b")
+CHANGE_PATTERN = re.compile(r"\(\s*([+-]?[\d,]+)\s*\)")
+ID_PATTERN = re.compile(r"[?&]id=(\d+)")
+
+# Reuse one libxml2 HTML parser; it keeps no per-document state between calls
+HTML_PARSER = etree.HTMLParser(remove_comments=True, no_network=True)
+
+# One participant's standing in one project
+class ParticipantStats:
+    __slots__ = ("project_name", "rank", "overall", "updated")
+
+    def __init__(self, project_name, rank, overall, updated):
+        self.project_name = project_name
+        self.rank = rank  # current rank, or None if the page had none
+        self.overall = overall  # overall rank, or None
+        self.updated = updated  # datetime.date the stats were last updated, or None
+
+    def as_dict(self):
+        return {"project_name": self.project_name, "rank": self.rank, "overall": self.overall, "updated": self.updated}
+
+    def __eq__(self, other):
+        return isinstance(other, ParticipantStats) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f"ParticipantStats({self.project_name!r}, rank={self.rank}, overall={self.overall}, updated={self.updated})"
+
+def parse_rank(text):
+    match = RANK_PATTERN.match(text)
+    return int(match.group(1).replace(",", "")) if match and match.group(1).strip(",") else None
+
+def parse_date(text):
+    match = DATE_PATTERN.search(text)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%d-%b-%Y").date()
+    except ValueError:
+        return None
+
+# The stats on a participant summary page (str or raw bytes); None for a search page that found no
+# single participant. Bytes are best: libxml2 then decodes using the page's own charset
+def parse_participant(html):
+    root = etree.fromstring(html, HTML_PARSER) if html else None
+    if root is None:
+        return None
+    title = TITLE(root)
+    if "Summary" not in title:
+        return None
+    ranks = [parse_rank(CELL_TEXT(cell)) for cell in RANKS(root)] + [None, None]
+    return ParticipantStats(title.split("/")[0].strip(), ranks[1], ranks[0], parse_date(UPDATED(root)))
+
+# One page of a project's participant listing: (stats date or None, [(rank, participant id,
+# name, rank change or None), ...]) in page order; empty past the end of the listing
+def parse_leaderboard(html):
+    root = etree.fromstring(html, HTML_PARSER) if html else None
+    if root is None:
+        return None, []
+    rows = []
+    for row in LIST_ROWS(root):
+        rank_text = LIST_RANK(row)
+        rank = parse_rank(rank_text)
+        link = LIST_LINK(row)[0]
+        participant = ID_PATTERN.search(link.get("href", ""))
+        if rank is None or participant is None:
+            continue
+        change = CHANGE_PATTERN.search(rank_text)
+        rows.append((rank, int(participant.group(1)), CELL_TEXT(link),
+                     int(change.group(1).replace(",", "")) if change else None))
+    return parse_date(UPDATED(root)), rows
+
+# The previous approach, kept for the benchmark: a full BeautifulSoup tree, a walk over every
+# right-aligned cell and fixed character offsets into the last-update banner
+def parse_with_soup(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "lxml")
+    title = soup.find("td", class_="htitle")
+    summary = title.text.lstrip() if title else ""
+    if "Summary" not in summary:
+        return None
+    projectName = " ".join(summary.split()).split("/")[0].strip()
+
+    overallRank = currentRank = None
+    line = 0
+    for match in soup.find_all("td", align="right"):
+        line += 1
+        if line == 1:
+            overallRank = parse_rank(match.text)
+        if line == 2:
+            currentRank = parse_rank(match.text)
+            break
+
+    updated = None
+    lastUpdate = soup.find("td", class_="lastupdate")
+    if lastUpdate and len(lastUpdate.text.split()) > 8:
+        stamp = lastUpdate.text.split()[8].lstrip()
+        try:
+            updated = datetime.strptime(f"{stamp[3:6]} {stamp[0:2]} {stamp[7:12]}", "%b %d %Y").date()
+        except ValueError:
+            pass
+    return ParticipantStats(projectName, currentRank, overallRank, updated)
+
+PARSERS = {"lxml": parse_participant, "soup": parse_with_soup}
+
+# The documents each parser builds, for sizing them
+def soup_tree(html):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "lxml")
+
+TREES = {"lxml": lambda html: etree.fromstring(html, HTML_PARSER), "soup": soup_tree}
+
+WARM_UP = (b"<html><body><table><tr><td class='htitle'>X / Summary</td><td align='right'>1</td></tr>"
+           b"<tr><td class='lastupdate'>The stats shown here were last updated on 17-Oct-2026 at 00:05 UTC.</td></tr>"
+           b"</table></body></html>")
+
+# Memory per page, run in a fresh interpreter. tracemalloc gives the Python heap peak of one parse
+# but cannot see libxml2's own allocations, so also hold `keep` parsed trees at once and take
+# the growth in peak RSS per tree, which counts everything
+def measure_memory(name, path, keep, results):
+    import resource  # Unix only, and only the benchmark needs it
+    with open(path, "rb") as f:
+        html = f.read()
+    PARSERS[name](WARM_UP)  # load imports and caches outside the measurement
+    tracemalloc.start()
+    PARSERS[name](html)
+    _, heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    trees = [TREES[name](html) for _ in range(keep)]
+    grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    results.put((heap, grown * (1 if sys.platform == "darwin" else 1024) / len(trees)))
+
+def peak_memory(name, path, keep=200):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=measure_memory, args=(name, path, keep, results))
+    process.start()
+    peak = results.get()
+    process.join()
+    return peak
+
+# Compare parse time and peak memory of both parsers over each fixture (and check they agree)
+def benchmark(paths, rounds=200):
+    print(f"{'fixture':<34}{'parser':>7}{'time':>11}{'heap peak':>12}{'tree rss':>11}")
+    for path in paths:
+        with open(path, "rb") as f:
+            html = f.read()
+        results = {name: parse(html) for name, parse in PARSERS.items()}
+        if results["lxml"] != results["soup"]:
+            print(f"{os.path.basename(path)}: parsers disagree: {results['lxml']} vs {results['soup']}")
+        timings = {}
+        for name, parse in PARSERS.items():
+            start = time.perf_counter()
+            for _ in range(rounds):
+                parse(html)
+            timings[name] = (time.perf_counter() - start) / rounds
+            heap, rss = peak_memory(name, path)
+            print(f"{os.path.basename(path):<34}{name:>7}{timings[name] * 1000:>9.3f}ms"
+                  f"{heap / 1024:>10,.0f}KB{rss / 1024:>9,.0f}KB")
+        print(f"{'':<34}{'':>7}{timings['soup'] / timings['lxml']:>9.1f}x faster")
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse distributed.net participant pages from HTML files.")
+    parser.add_argument("pages", nargs="*", help=f"HTML files (default: {FIXTURES}/*.html).")
+    parser.add_argument("--benchmark", action="store_true", help="Compare lxml XPath with BeautifulSoup parsing.")
+    parser.add_argument("--rounds", type=int, default=200, help="Benchmark repetitions per page.")
+    args = parser.parse_args()
+
+    pages = args.pages or sorted(glob.glob(os.path.join(FIXTURES, "*.html")))
+    if args.benchmark:
+        benchmark(pages, args.rounds)
+        return
+    for path in pages:
+        with open(path, "rb") as f:
+            print(f"{os.path.basename(path)}: {parse_participant(f.read())}")
+
+if __name__ == "__main__":
+    main()
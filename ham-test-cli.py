@@ -1,99 +1,38 @@
 #!/usr/bin/python3
 # Description: A command-line interface for the HAM Operator Test. 
-# Usage: python3 ham-test-cli.py
+# Usage: python3 ham-test-cli.py [--mode quiz|srs|exam] [--only <subelement|group>] [--exams N --seed S] [--search QUERY]
+#        python3 ham-test-cli.py --report
+#        python3 ham-test-cli.py --headless [--test <pool>] [--answers FILE|-] [--sessions N] [--workers N]
 # Author: Justin Oros
 # Source: https://github.com/JustinOros
 
+import sys
 import json
-import os
+import time
 import random
-import requests
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import ham_pool
+import ham_srs
+import ham_quiz
+import ham_stats
 import logging
 from datetime import datetime
 
 # Set up logging
 logging.basicConfig(level=logging.WARNING, format='[%(levelname)s] %(message)s')
 
-# URLs to download the latest official HAM exam question pools from GitHub
-URLS = {
-    "Technician": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/technician-2022-2026/technician.json",
-    "General": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/general-2023-2027/general.json",
-    "Extra": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/extra-2024-2028/extra.json"
-}
-
-# Corresponding local filenames for each question pool
-LOCAL_FILES = {
-    "Technician": "technician.json",
-    "General": "general.json",
-    "Extra": "extra.json"
-}
-
-# Get the Last-Modified timestamp of a remote file, used to detect updates
-def get_remote_last_modified(url):
-    try:
-        r = requests.head(url, timeout=10)
-        if r.status_code == 200 and 'Last-Modified' in r.headers:
-            lm = r.headers['Last-Modified']
-            dt = datetime.strptime(lm, '%a, %d %b %Y %H:%M:%S %Z')
-            return dt.timestamp()
-    except Exception as e:
-        logging.warning(f"Could not get Last-Modified for {url}: {e}")
-    return None
-
-# Download the file from GitHub and save it locally
-def download_file(url, local_path):
-    print(f"Downloading latest questions from {url} ...")
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    with open(local_path, "w", encoding='utf-8') as f:
-        f.write(r.text)
-    print(f"Saved to {local_path}")
-
-# Determine whether the local file is newer than the remote version
-def is_local_file_up_to_date(local_path, remote_timestamp):
-    if not os.path.exists(local_path):
-        return False
-    local_mtime = os.path.getmtime(local_path)
-    return local_mtime >= remote_timestamp
-
-# Sync all 3 test pools with the GitHub repo (if newer versions exist)
-def sync_files():
-    for test_name, url in URLS.items():
-        local_path = LOCAL_FILES[test_name]
-        remote_ts = get_remote_last_modified(url)
-        if remote_ts is None:
-            if not os.path.exists(local_path):
-                print(f"No local file for {test_name} and unable to get remote timestamp. Downloading anyway.")
-                download_file(url, local_path)
-            else:
-                print(f"Skipping update for {test_name} (no remote timestamp).")
-        else:
-            if not is_local_file_up_to_date(local_path, remote_ts):
-                print(f"{local_path} is outdated, updating it.")
-                download_file(url, local_path)
-            else:
-                print(f"{local_path} is up to date.")
-
-# Load questions from the locally stored JSON file
-def load_questions(test_name):
-    local_path = LOCAL_FILES[test_name]
-    if not os.path.exists(local_path):
-        print(f"Error: Local file {local_path} not found.")
-        return []
-    with open(local_path, "r", encoding='utf-8') as f:
-        return json.load(f)
-
 # Prompt the user to select one of the 3 test pools
 def select_test(attempts=3):
     # Prompt user to select an exam type
     print("\nSelect the test you want to take:\n")
-    for idx, name in enumerate(URLS.keys(), start=1):
+    for idx, name in enumerate(ham_pool.URLS.keys(), start=1):
         print(f"{idx}. {name} Class")
     
     while attempts > 0:
         choice = input("\nEnter number: ").strip()
         try:
-            return list(URLS.keys())[int(choice) - 1]
+            return list(ham_pool.URLS.keys())[int(choice) - 1]
         except (ValueError, IndexError):
             attempts -= 1
             print(f"\nInvalid choice. You have {attempts} attempts left.\n")
@@ -101,77 +40,236 @@ def select_test(attempts=3):
     print("\nToo many invalid attempts. Exiting.")
     exit(1)
 
+# Present one question and read the answer; returns the chosen letter, or None if the user quits
+# The time taken and the result are appended to the answer log (see ham_stats)
+def ask_question(presented, log=None):
+    print(f"\n{presented.question.question}\n")
+    for letter, _, ans_text in presented.options:
+        print(f"  {letter}. {ans_text}")
+    start = time.monotonic()
+
+    # Get the user's answer
+    letters = {o[0] for o in presented.options}
+    while True:
+        user_input = input("\nYour answer (A/B/C/D or Q to quit): ").strip().upper()
+        if user_input == 'Q':
+            return None
+        if user_input in letters:
+            break
+        else:
+            print("\nInvalid input. Please enter A, B, C, D or Q.")
+    if log is not None:
+        log.record(presented.question.id, presented.is_correct(user_input), time.monotonic() - start)
+
+    # Show whether the answer was right
+    if presented.is_correct(user_input):
+        print("\n✅ Correct!\n")
+    else:
+        print(f"\n❌ Incorrect. The correct answer is {presented.correct_letter}. {presented.correct_answer}\n")
+    return user_input
+
 # Core quiz loop: presents questions, checks answers, tracks score
-def run_quiz(questions):
+def run_quiz(questions, log=None):
+    session = ham_quiz.QuizSession(questions)  # Randomize question order each session
+    print("\nPress 'Q' at any time to quit.\n")
+
+    while True:
+        presented = session.next()
+        if presented is None:
+            break
+        letter = ask_question(presented, log)
+        if letter is None:
+            print("\nExiting test.")
+            print(f"\nFinal score: {session.score}/{session.total}")
+            return
+        session.answer(letter)
+
+    score, total = session.score, session.total
+    percentage = (score / total) * 100 if total > 0 else 0
+    print(f"Test completed. Score: {score}/{total} ({percentage:.2f}%)")
+
+# Spaced-repetition loop: asks whatever is due next and remembers the result
+def run_srs(questions, log=None):
+    scheduler = ham_srs.Scheduler(questions)
     score = 0
     total = 0
-    random.shuffle(questions)  # Randomize question order each session
-    print("\nPress 'Q' at any time to quit.\n")
+    print("\nSpaced repetition mode. Press 'Q' at any time to quit.\n")
 
-    for q in questions:
-        question_text = q.get("question")
-        answers = q.get("answers", [])
-        correct_index = q.get("correct")
-
-        # Skip if the structure is invalid
-        if not question_text or not answers or correct_index is None:
-            continue
-        if correct_index < 0 or correct_index >= len(answers):
-            logging.warning(f"Skipping question with invalid correct index: {question_text}")
-            continue
-
-        # Pair each answer with whether it is correct
-        answer_options = [(i, ans, i == correct_index) for i, ans in enumerate(answers)]
-        random.shuffle(answer_options)  # Shuffle answer order
-
-        # Create a letter map from shuffled options
-        letter_map = {}
-        correct_letter = None
-        for idx, (orig_index, ans_text, is_correct) in enumerate(answer_options):
-            letter = chr(65 + idx)
-            letter_map[letter] = (orig_index, ans_text)
-            if is_correct:
-                correct_letter = letter
-                correct_answer = ans_text
-
-        print(f"\n{question_text}\n")
-        for letter in sorted(letter_map.keys()):
-            print(f"  {letter}. {letter_map[letter][1]}")
-
-        # Get the user's answer
+    try:
         while True:
-            user_input = input("\nYour answer (A/B/C/D or Q to quit): ").strip().upper()
-            if user_input == 'Q':
-                print("\nExiting test.")
-                print(f"\nFinal score: {score}/{total}")
-                return
-            if user_input in letter_map:
+            q = scheduler.next()
+            if q is None:
+                next_due = scheduler.next_due()
+                when = datetime.fromtimestamp(next_due).strftime('%Y-%m-%d %H:%M') if next_due else "never"
+                print(f"\nNothing left to review. Next review due: {when}")
                 break
-            else:
-                print("\nInvalid input. Please enter A, B, C, D or Q.")
-
-        # Score the answer
-        total += 1
-        selected_index = letter_map[user_input][0]
-        if selected_index == correct_index:
-            print("\n✅ Correct!\n")
-            score += 1
-        else:
-            print(f"\n❌ Incorrect. The correct answer is {correct_letter}. {correct_answer}\n")
+            presented = ham_quiz.present(q)
+            letter = ask_question(presented, log)
+            if letter is None:
+                print("\nExiting review.")
+                break
+            result = presented.is_correct(letter)
+            scheduler.record(q, result)
+            total += 1
+            score += result
+    finally:
+        scheduler.close()
 
-    percentage = (score / total) * 100 if total > 0 else 0
-    print(f"Test completed. Score: {score}/{total} ({percentage:.2f}%)")
+    print(f"\nReviewed: {total}, correct: {score}")
+
+# Exam simulation: one question per group, graded against the FCC passing score
+def run_exam(pool, seed=None, log=None):
+    exam = pool.build_exam(random.Random(seed))
+    passing = ham_pool.PASSING_SCORES[pool.name]
+    score = 0
+    print(f"\n{pool.name} exam: {len(exam)} questions, {passing} correct to pass. Press 'Q' at any time to quit.\n")
+
+    for number, q in enumerate(exam, start=1):
+        print(f"Question {number} of {len(exam)} ({q.id})")
+        presented = ham_quiz.present(q)
+        letter = ask_question(presented, log)
+        if letter is None:
+            print("\nExiting exam.")
+            print(f"\nScore so far: {score}/{number - 1}")
+            return
+        score += presented.is_correct(letter)
+
+    verdict = "PASS" if score >= passing else "FAIL"
+    print(f"Exam completed. Score: {score}/{len(exam)} ({score / len(exam) * 100:.2f}%) - {verdict}")
+
+# Write seeded exams as JSON lines (question ids and answer key) for printing or offline grading
+def write_exams(pool, count, seed, output):
+    with open(output, "w", encoding="utf-8") as f:
+        for number, exam in pool.generate_exams(count, seed):
+            f.write(json.dumps({
+                "pool": pool.name,
+                "seed": seed,
+                "exam": number,
+                "questions": [q.id for q in exam],
+                "key": "".join(chr(65 + q.correct) for q in exam),
+            }) + "\n")
+    print(f"Wrote {count:,} {pool.name} exams to {output}")
+
+# Print every question matching a search query across all pools
+def run_search(query):
+    results = ham_pool.search(query)
+    for test_name, q in results:
+        print(f"\n{q.id} ({test_name}) {q.refs}")
+        print(f"  {q.question}")
+        print(f"  Answer: {q.answers[q.correct]}")
+    print(f"\n{len(results)} question(s) found for {query!r}.")
+
+# Headless benchmark: run scripted or simulated sessions back-to-back (or across processes)
+def run_headless(test_name, only, sessions, workers, seed, script, skill):
+    workers = max(1, min(workers, sessions))
+    chunk = -(-sessions // workers)
+    jobs = [(test_name, only, first, min(chunk, sessions - first), seed, script, skill)
+            for first in range(0, sessions, chunk)]
+
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(ham_quiz.run_sessions, *zip(*jobs)))
+    else:
+        parts = [ham_quiz.run_sessions(*job) for job in jobs]
+    elapsed = time.perf_counter() - start
+
+    score = sum(p[0] for p in parts)
+    total = sum(p[1] for p in parts)
+    latencies = sorted(x for p in parts for x in p[2])
+    for problem in (message for p in parts for message in p[3]):
+        logging.warning(problem)
+    print(f"Pool: {test_name}{' (' + only + ')' if only else ''}, answers: {'script' if script is not None else f'simulated (skill {skill})'}")
+    print(f"Sessions: {sessions:,} in {elapsed:.2f}s with {workers} worker(s) = {sessions / elapsed:,.1f} sessions/s")
+    print(f"Questions: {total:,} = {total / elapsed:,.0f} questions/s, score {score / total * 100 if total else 0:.1f}%")
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"Per-question latency: p50 {p50 * 1e6:.1f}us, p99 {p99 * 1e6:.1f}us")
+
+# Read a headless answer script: letters separated by whitespace, Q ends a session and the
+# letters after it answer the next one
+def read_answer_script(path):
+    if path == '-':
+        return sys.stdin.read().split()
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().split()
+
+# Parse command-line arguments
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='HAM Radio Operator License test preparation.')
+    parser.add_argument('--only', metavar='KEY', help='Only ask a subelement (T1), group (T1A) or question (T1A01).')
+    parser.add_argument('--mode', choices=['quiz', 'srs', 'exam'], default='quiz',
+                        help='quiz: whole pool in random order; srs: spaced repetition with saved progress; '
+                             'exam: one question per group, like the real exam.')
+    parser.add_argument('--search', metavar='QUERY',
+                        help='Search all pools: words are ANDed, "quoted phrases", prefix* terms.')
+    parser.add_argument('--test', choices=list(ham_pool.URLS.keys()), help='Pool to use instead of asking.')
+    parser.add_argument('--headless', action='store_true',
+                        help='Run sessions without a terminal, answering from --answers or a simulated student.')
+    parser.add_argument('--answers', metavar='FILE', help="Headless answer script (letters, Q to quit; '-' for stdin).")
+    parser.add_argument('--skill', type=float, default=0.75, help='Simulated student accuracy on known questions.')
+    parser.add_argument('--sessions', type=int, default=1000, help='Headless sessions to run.')
+    parser.add_argument('--workers', type=int, default=1, help='Headless worker processes.')
+    parser.add_argument('--seed', type=int, help='Seed for exam mode, to reproduce an exam.')
+    parser.add_argument('--exams', type=int, metavar='N', help='Generate N seeded exams instead of taking one.')
+    parser.add_argument('--output', default='exams.jsonl', help='Output file for --exams.')
+    parser.add_argument('--report', action='store_true',
+                        help='Show accuracy and median answer time per subelement and group.')
+    args = parser.parse_args()
+    if args.sessions < 1:
+        parser.error('--sessions must be at least 1')
+    return args
 
 # Main program flow
 def main():
+    args = parse_arguments()
+    if args.report:
+        ham_stats.report()
+        return
+    if args.search:
+        run_search(args.search)
+        return
+    if args.exams and args.mode != 'exam':
+        args.mode = 'exam'
+    if args.mode == 'exam' and args.only:
+        print("Exam mode always uses the whole pool; --only is ignored.")
+        args.only = None
+    test_name = ham_pool.pool_for_key(args.only)
+    if args.only and test_name is None:
+        print(f"Unknown subelement or group: {args.only}")
+        return
+    test_name = test_name or args.test
+
+    if args.headless:
+        # Local pools only, so runs are reproducible and not skewed by the network
+        script = read_answer_script(args.answers) if args.answers else None
+        run_headless(test_name or "Technician", args.only, args.sessions, args.workers,
+                     args.seed or 0, script, args.skill)
+        return
+
     print("Syncing question files...")
-    sync_files()
-    test_name = select_test()
-    questions = load_questions(test_name)
+    ham_pool.sync_files()
+    if test_name is None:
+        test_name = select_test()
+    pool = ham_pool.load_questions(test_name)
+    questions = pool.select(args.only)
     if not questions:
         print("No questions found.")
         return
-    run_quiz(questions)
+    if args.mode == 'exam' and args.exams:
+        write_exams(pool, args.exams, args.seed or 0, args.output)
+        return
+    log = ham_stats.AttemptLog()
+    try:
+        if args.mode == 'exam':
+            run_exam(pool, args.seed, log)
+        elif args.mode == 'srs':
+            run_srs(questions, log)
+        else:
+            run_quiz(questions, log)
+    finally:
+        log.close()
 
 if __name__ == "__main__":
     main()
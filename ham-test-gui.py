@@ -1,94 +1,63 @@
 #!/usr/bin/python3
 # Description: A Python-GUI interface for the HAM Operator Test. 
-# Usage: python3 ham-test-gui.py
+# Usage: python3 ham-test-gui.py  (HAM_GUI_DEBUG=1 to log per-question render time)
 # Author: Justin Oros
 # Source: https://github.com/JustinOros
 
-import json
 import os
+import time
+import queue
 import random
-import requests
+import threading
+import ham_pool
+import ham_srs
+import ham_stats
 import logging
-from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox
 
 # --- Setup logging ---
 logging.basicConfig(level=logging.WARNING, format='[%(levelname)s] %(message)s')
 
-# --- URLs and Local file paths ---
-URLS = {
-    "Technician": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/technician-2022-2026/technician.json",
-    "General": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/general-2023-2027/general.json",
-    "Extra": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/extra-2024-2028/extra.json"
-}
-
-LOCAL_FILES = {
-    "Technician": "technician.json",
-    "General": "general.json",
-    "Extra": "extra.json"
-}
-
-# --- Helper functions to sync question files ---
-
-def get_remote_last_modified(url):
-    try:
-        r = requests.head(url, timeout=10)
-        if r.status_code == 200 and 'Last-Modified' in r.headers:
-            lm = r.headers['Last-Modified']
-            dt = datetime.strptime(lm, '%a, %d %b %Y %H:%M:%S %Z')
-            return dt.timestamp()
-    except Exception as e:
-        logging.warning(f"Could not get Last-Modified for {url}: {e}")
-    return None
-
-def download_file(url, local_path):
-    print(f"Downloading latest questions from {url} ...")
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    with open(local_path, "w", encoding='utf-8') as f:
-        f.write(r.text)
-    print(f"Saved to {local_path}")
-
-def is_local_file_up_to_date(local_path, remote_timestamp):
-    if not os.path.exists(local_path):
-        return False
-    local_mtime = os.path.getmtime(local_path)
-    return local_mtime >= remote_timestamp
-
-def sync_files():
-    for test_name, url in URLS.items():
-        local_path = LOCAL_FILES[test_name]
-        remote_ts = get_remote_last_modified(url)
-        if remote_ts is None:
-            if not os.path.exists(local_path):
-                print(f"No local file for {test_name} and unable to get remote timestamp. Downloading anyway.")
-                download_file(url, local_path)
-            else:
-                print(f"Skipping update for {test_name} (no remote timestamp).")
-        else:
-            if not is_local_file_up_to_date(local_path, remote_ts):
-                print(f"{local_path} is outdated, updating it.")
-                download_file(url, local_path)
-            else:
-                print(f"{local_path} is up to date.")
+# Set HAM_GUI_DEBUG=1 to show and log how long each question takes to render. Only this
+# app's logger goes to DEBUG, so libraries such as urllib3 stay at WARNING
+DEBUG_RENDER = bool(os.environ.get("HAM_GUI_DEBUG"))
+logger = logging.getLogger("ham-test-gui")
+if DEBUG_RENDER:
+    logger.setLevel(logging.DEBUG)
+
+# How often the quiz window checks for background sync progress (ms)
+UPDATE_POLL_MS = 100
 
-def load_questions(test_name):
-    local_path = LOCAL_FILES[test_name]
-    if not os.path.exists(local_path):
-        print(f"Error: Local file {local_path} not found.")
-        return []
-    with open(local_path, "r", encoding='utf-8') as f:
-        return json.load(f)
+# --- Background sync ---
+
+# Runs on a worker thread: sync every pool and report through a queue polled by the Tk main loop
+def background_sync(updates):
+    results = ham_pool.sync_files(report=lambda message: updates.put(("status", message)))
+    for test_name, result in results.items():
+        # A download of the same questions (e.g. only the file's timestamp changed) is not a newer pool
+        if result.status == "updated" and (result.diff or result.diff.reordered):
+            updates.put(("pool", ham_pool.load_questions(test_name)))
+    updates.put(("done", None))
 
 # --- GUI Classes ---
 
 class QuizGUI:
-    def __init__(self, master, questions):
+    def __init__(self, master, pool, mode="quiz", only=None, updates=None):
         self.master = master
         self.master.title("HAM Radio Quiz")
-        self.questions = questions
-        random.shuffle(self.questions)
+        self.pool = pool
+        self.pending_pool = None  # newer pool from the background sync, used from the next session
+        self.mode = mode
+        self.only = only
+        self.updates = updates  # queue.Queue filled by background_sync()
+        self.questions = ()
+        self.scheduler = None  # ham_srs.Scheduler in spaced-repetition mode
+        self.passing = None  # passing score in exam mode (questions stay in group order)
+        self.order = []
+        self.current_question = None
+        self.shown_at = None  # when the current question appeared, for the answer log
+        self.log = ham_stats.AttemptLog()
 
         self.score = 0
         self.total = 0
@@ -96,6 +65,10 @@ class QuizGUI:
         self.correct_answer = None
         self.next_pending = False
         self.correct_answer_text = ""
+        self.prepared = None  # next question, prepared during the feedback delay
+        self.answer_buttons = []
+        self.visible_answers = 0
+        self.width = None
 
         self.feedback_label = tk.Label(master, text="", font=("Arial", 14), wraplength=800, justify="left")
         self.feedback_label.pack(pady=5)
@@ -116,63 +89,183 @@ class QuizGUI:
         self.next_button = tk.Button(nav_frame, text="Next", command=self.check_answer)
         self.next_button.pack(side=tk.LEFT, padx=5)
 
+        status_frame = tk.Frame(master)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+        self.status_label = tk.Label(status_frame, text="", fg="gray", anchor="w")
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.render_label = tk.Label(status_frame, text="", fg="gray", anchor="e")
+        if DEBUG_RENDER:
+            self.render_label.pack(side=tk.RIGHT)
+
+        if self.updates is not None:
+            self.master.after(UPDATE_POLL_MS, self.poll_updates)
+        self.start_session()
+
+    # Start a session from the current pool, switching to a newer one first if it arrived
+    def start_session(self):
+        if self.pending_pool is not None:
+            self.pool, self.pending_pool = self.pending_pool, None
+            self.status_label.config(text=f"Using the updated {self.pool.name} question pool.")
+        if self.scheduler is not None:
+            self.scheduler.close()
+            self.scheduler = None
+        self.passing = None
+
+        questions = self.pool.select(self.only)
+        if questions and self.mode == "srs":
+            self.scheduler = ham_srs.Scheduler(questions)
+        elif questions and self.mode == "exam":
+            questions = self.pool.build_exam()
+            self.passing = ham_pool.PASSING_SCORES[self.pool.name]
+
+        self.questions = questions
+        self.order = list(range(len(questions)))
+        if self.passing is None:
+            random.shuffle(self.order)
+        self.score = 0
+        self.total = 0
+        self.current_index = -1
+        self.prepared = None
+
+        if not questions:
+            if self.pool:
+                self.question_label.config(text="No questions found.")
+            else:
+                # Nothing local yet: wait for the background sync to deliver the pool
+                self.question_label.config(text="Waiting for the question pool to download...")
+            self.next_pending = True
+            return
         self.load_next_question()
 
+    # Drain messages from the sync thread; runs on the Tk main loop via after()
+    def poll_updates(self):
+        done = False
+        while True:
+            try:
+                kind, value = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "status":
+                self.status_label.config(text=value)
+            elif kind == "pool" and value.name == self.pool.name and len(value):
+                if not self.questions:
+                    self.pool = value
+                    self.start_session()
+                else:
+                    self.pending_pool = value
+                    self.status_label.config(text="A newer question pool was downloaded; it will be used next session.")
+            elif kind == "done":
+                done = True
+        if not done:
+            self.master.after(UPDATE_POLL_MS, self.poll_updates)
+        elif not self.pool:
+            self.download_failed()
+
+    # The sync finished without delivering the pool: say so and offer to try again
+    def download_failed(self):
+        message = f"The {self.pool.name} question pool could not be downloaded."
+        self.question_label.config(text=message)
+        if messagebox.askretrycancel("Download Failed", f"{message}\nCheck your internet connection and try again."):
+            self.question_label.config(text="Waiting for the question pool to download...")
+            threading.Thread(target=background_sync, args=(self.updates,), daemon=True).start()
+            self.master.after(UPDATE_POLL_MS, self.poll_updates)
+
     def resize_to_fit_text(self, text):
         avg_char_width = 7
         padding = 60
         max_width = 1000
         min_width = 400
         estimated_width = min(max(len(text) * avg_char_width + padding, min_width), max_width)
-        self.master.geometry(f"{estimated_width}x400")
+        self.set_width(estimated_width)
+
+    # Only touch the window geometry (a full relayout) when the width actually changes
+    def set_width(self, width):
+        if width != self.width:
+            self.width = width
+            self.master.geometry(f"{width}x400")
+
+    # Answer widgets are created once and reconfigured for every question
+    def answer_button(self, slot):
+        while len(self.answer_buttons) <= slot:
+            self.answer_buttons.append(tk.Radiobutton(
+                self.answers_frame,
+                variable=self.selected_answer,
+                value=str(len(self.answer_buttons)),
+                justify="left",
+                anchor="w",
+                padx=10,
+                font=("Arial", 11)
+            ))
+        return self.answer_buttons[slot]
 
-    def load_next_question(self):
+    # Next question from the scheduler (spaced repetition) or the shuffled order, or None
+    def next_question(self):
+        if self.scheduler is not None:
+            return self.scheduler.next()
         self.current_index += 1
-
         if self.current_index >= len(self.questions):
+            return None
+        return self.questions[self.order[self.current_index]]
+
+    # Pick, decode and shuffle the next question; (None, ...) at the end of the session
+    def prepare_question(self):
+        q = self.next_question()
+        if q is None:
+            return None, None, None, None
+        question_text = q.question
+        options = list(enumerate(q.answers))
+        random.shuffle(options)
+        width = min(max(400, len(question_text) * 7), 800)
+        return q, question_text, options, width
+
+    def load_next_question(self):
+        start = time.perf_counter()
+        prepared, self.prepared = self.prepared, None
+        q, question_text, options, width = prepared or self.prepare_question()
+
+        if q is None:
             pct = (self.score / self.total) * 100 if self.total > 0 else 0
-            messagebox.showinfo("Quiz Finished", f"Score: {self.score}/{self.total} ({pct:.2f}%)")
-            self.master.destroy()
+            title = "Review Finished" if self.scheduler is not None else "Quiz Finished"
+            message = f"Score: {self.score}/{self.total} ({pct:.2f}%)"
+            if self.passing is not None:
+                title = "Exam Finished"
+                verdict = "PASS" if self.score >= self.passing else "FAIL"
+                message += f"\n{verdict} ({self.passing} needed to pass)"
+            if messagebox.askyesno(title, message + "\n\nStart another session?"):
+                self.start_session()
+            else:
+                self.close()
             return
 
         self.feedback_label.config(text="")
-        self.selected_answer.set(None)
-
-        for widget in self.answers_frame.winfo_children():
-            widget.destroy()
+        self.selected_answer.set("")
+        self.current_question = q
 
-        q = self.questions[self.current_index]
-        question_text = q.get("question")
-        answers = q.get("answers", [])
-        correct_index = q.get("correct")
-
-        width = min(max(400, len(question_text) * 7), 800)
-        self.master.geometry(f"{width}x400")
+        self.set_width(width)
         self.question_label.config(text=question_text)
 
-        options = list(enumerate(answers))
-        random.shuffle(options)
-
         self.correct_answer = None
         self.correct_answer_text = ""
-        for idx, (orig_index, ans_text) in enumerate(options):
-            rb = tk.Radiobutton(
-                self.answers_frame,
-                text=ans_text,
-                variable=self.selected_answer,
-                value=ans_text,
-                wraplength=width - 50,
-                justify="left",
-                anchor="w",
-                padx=10,
-                font=("Arial", 11)
-            )
-            rb.pack(anchor="w", pady=2)
-            if orig_index == correct_index:
-                self.correct_answer = ans_text
+        for slot, (orig_index, ans_text) in enumerate(options):
+            rb = self.answer_button(slot)
+            rb.config(text=ans_text, wraplength=width - 50)
+            if slot >= self.visible_answers:
+                rb.pack(anchor="w", pady=2)
+            if orig_index == q.correct:
+                self.correct_answer = str(slot)
                 self.correct_answer_text = ans_text
+        for rb in self.answer_buttons[len(options):self.visible_answers]:
+            rb.pack_forget()
+        self.visible_answers = len(options)
 
         self.next_pending = False
+        self.shown_at = time.monotonic()
+
+        if DEBUG_RENDER:
+            self.master.update_idletasks()  # include layout in the measurement
+            elapsed = (time.perf_counter() - start) * 1000
+            self.render_label.config(text=f"{q.id} rendered in {elapsed:.1f} ms")
+            logger.debug(f"{q.id} rendered in {elapsed:.2f} ms{' (prepared)' if prepared else ''}")
 
     def check_answer(self):
         if self.next_pending:
@@ -184,7 +277,11 @@ class QuizGUI:
             return
 
         self.total += 1
-        if selected == self.correct_answer:
+        is_correct = selected == self.correct_answer
+        if self.scheduler is not None:
+            self.scheduler.record(self.current_question, is_correct)
+        self.log.record(self.current_question.id, is_correct, time.monotonic() - self.shown_at)
+        if is_correct:
             self.score += 1
             self.feedback_label.config(text="Correct!", fg="green")
             delay = 1500  # 1.5 sec
@@ -196,32 +293,112 @@ class QuizGUI:
 
         self.next_pending = True
         self.master.after(delay, self.load_next_question)
+        # Use the feedback delay to get the next question ready
+        self.prepared = self.prepare_question()
 
     def quit_quiz(self):
         pct = (self.score / self.total) * 100 if self.total > 0 else 0
         messagebox.showinfo("Quit Quiz", f"Questions answered: {self.total}\nCorrect: {self.score}\nPercentage: {pct:.2f}%")
+        self.close()
+
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+        self.log.close()
         self.master.destroy()
 
 
+class SearchGUI:
+    def __init__(self, master):
+        self.window = tk.Toplevel(master)
+        self.window.title("Search Questions")
+        self.pools = [ham_pool.load_questions(name) for name in ham_pool.LOCAL_FILES]
+        self.pending = None
+
+        entry_frame = tk.Frame(self.window)
+        entry_frame.pack(fill=tk.X, padx=10, pady=10)
+        tk.Label(entry_frame, text='Search (words, "phrases", prefix*):').pack(side=tk.LEFT)
+        self.query = tk.StringVar()
+        entry = tk.Entry(entry_frame, textvariable=self.query, width=40)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        entry.bind("<KeyRelease>", self.schedule_search)
+        entry.focus_set()
+
+        self.status_label = tk.Label(self.window, text="", anchor="w")
+        self.status_label.pack(fill=tk.X, padx=10)
+
+        self.results = tk.Text(self.window, width=90, height=25, wrap="word", font=("Arial", 11))
+        self.results.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.results.config(state=tk.DISABLED)
+
+    # Search shortly after typing stops rather than on every keystroke
+    def schedule_search(self, event=None):
+        if self.pending is not None:
+            self.window.after_cancel(self.pending)
+        self.pending = self.window.after(150, self.run_search)
+
+    def run_search(self):
+        self.pending = None
+        query = self.query.get().strip()
+        matches = [(pool.name, q) for pool in self.pools for q in pool.search(query)] if query else []
+
+        self.results.config(state=tk.NORMAL)
+        self.results.delete("1.0", tk.END)
+        for test_name, q in matches:
+            self.results.insert(tk.END, f"{q.id} ({test_name}) {q.refs}\n{q.question}\nAnswer: {q.answers[q.correct]}\n\n")
+        self.results.config(state=tk.DISABLED)
+        self.status_label.config(text=f"{len(matches)} question(s) found" if query else "")
+
+
 class TestSelectGUI:
     def __init__(self, master):
         self.master = master
         self.master.title("Select Test")
         self.selected_test = None
+        self.only = None
+        self.selected_mode = "quiz"
 
         label = tk.Label(master, text="Select the test you want to take:", font=("Arial", 14))
         label.pack(padx=10, pady=10)
 
-        for test_name in URLS.keys():
+        for test_name in ham_pool.URLS.keys():
             btn = tk.Button(master, text=test_name, width=20, command=lambda tn=test_name: self.select_test(tn))
             btn.pack(pady=5)
 
+        only_frame = tk.Frame(master)
+        only_frame.pack(pady=10)
+        tk.Label(only_frame, text="Only (e.g. T1, G2E):").pack(side=tk.LEFT)
+        self.only_entry = tk.Entry(only_frame, width=8)
+        self.only_entry.pack(side=tk.LEFT, padx=5)
+
+        tk.Button(master, text="Search Questions...", command=lambda: SearchGUI(master)).pack(pady=5)
+
+        self.mode = tk.StringVar(value="quiz")
+        mode_frame = tk.Frame(master)
+        mode_frame.pack(pady=5)
+        tk.Radiobutton(mode_frame, text="Quiz", variable=self.mode, value="quiz").pack(side=tk.LEFT)
+        tk.Radiobutton(mode_frame, text="Spaced repetition", variable=self.mode, value="srs").pack(side=tk.LEFT)
+        tk.Radiobutton(mode_frame, text="Exam", variable=self.mode, value="exam").pack(side=tk.LEFT)
+
     def select_test(self, test_name):
+        only = self.only_entry.get().strip().upper()
+        if only and self.mode.get() == "exam":
+            messagebox.showwarning("Invalid Selection", "Exam mode always uses the whole pool.")
+            return
+        if only and ham_pool.pool_for_key(only) != test_name:
+            messagebox.showwarning("Invalid Selection", f"{only} is not part of the {test_name} pool.")
+            return
         self.selected_test = test_name
+        self.only = only or None
+        self.selected_mode = self.mode.get()
         self.master.destroy()
 
 
 def main():
+    # Sync in the background while the user picks a test; the quiz starts from the local pool
+    updates = queue.Queue()
+    threading.Thread(target=background_sync, args=(updates,), daemon=True).start()
+
     root = tk.Tk()
     select_gui = TestSelectGUI(root)
     root.mainloop()
@@ -232,16 +409,13 @@ def main():
         return
 
     print(f"Selected test: {test_name}")
-    print("Syncing question files...")
-    sync_files()
-
-    questions = load_questions(test_name)
-    if not questions:
+    pool = ham_pool.load_questions(test_name)
+    if pool and not pool.select(select_gui.only):
         print("No questions found.")
         return
 
     root = tk.Tk()
-    app = QuizGUI(root, questions)
+    app = QuizGUI(root, pool, select_gui.selected_mode, select_gui.only, updates)
     root.mainloop()
 
 
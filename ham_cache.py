@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+# Description: Compiled binary cache for the HAM exam question pools.
+# Usage: python3 ham_cache.py [--benchmark] [--rounds N]
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import argparse
+from array import array
+from collections.abc import Sequence
+import ham_sync
+
+# Cache files live next to their pool: technician.json -> technician.qcache
+CACHE_SUFFIX = ".qcache"
+
+MAGIC = b"HQC1"
+VERSION = 1
+
+# magic, version, source mtime_ns, source size, source sha256, questions, strings, blob bytes
+HEADER = struct.Struct("<4sHxxqQ32sIII")
+
+# Every question is stored as consecutive strings: id, question, refs, answer 0..n
+FIXED_FIELDS = 3
+
+# Tables are stored little-endian; swap them on big-endian machines
+NEEDS_SWAP = sys.byteorder != "little"
+
+def cache_path(json_path):
+    return os.path.splitext(json_path)[0] + CACHE_SUFFIX
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.digest()
+
+# Return None if a question can be stored, otherwise the reason it can't
+def invalid_reason(q):
+    if not isinstance(q, dict):
+        return "not an object"
+    if not q.get("id") or not q.get("question") or not q.get("answers"):
+        return "missing id, question or answers"
+    correct = q.get("correct")
+    if not isinstance(correct, int) or not 0 <= correct < len(q["answers"]):
+        return f"invalid correct index {correct!r}"
+    return None
+
+def _le(table):
+    if NEEDS_SWAP:
+        table = array(table.typecode, table)
+        table.byteswap()
+    return table.tobytes()
+
+# Serialize parsed questions into the cache format and return the bytes
+def compile_bytes(questions, mtime_ns=0, size=0, digest=b"\0" * 32):
+    offsets = array("I", [0])
+    first = array("I")
+    correct = array("b")
+    chunks = []
+    total = 0
+
+    for q in questions:
+        reason = invalid_reason(q)
+        if reason:
+            logging.warning(f"Skipping question {q.get('id') if isinstance(q, dict) else q!r}: {reason}")
+            continue
+        first.append(len(offsets) - 1)
+        correct.append(q["correct"])
+        for text in [q["id"], q["question"], q.get("refs") or ""] + list(q["answers"]):
+            data = str(text).encode("utf-8")
+            chunks.append(data)
+            total += len(data)
+            offsets.append(total)
+    first.append(len(offsets) - 1)
+
+    header = HEADER.pack(MAGIC, VERSION, mtime_ns, size, digest,
+                         len(correct), len(offsets) - 1, total)
+    return b"".join([header, _le(offsets), _le(first), _le(correct)] + chunks)
+
+# Parse a JSON pool and write its compiled cache next to it
+def compile_pool(json_path):
+    st = os.stat(json_path)
+    with open(json_path, "rb") as f:
+        raw = f.read()
+    data = compile_bytes(json.loads(raw), st.st_mtime_ns, st.st_size, hashlib.sha256(raw).digest())
+    ham_sync.atomic_write(cache_path(json_path), data)
+    return data
+
+# Read-only view over a compiled pool; questions are decoded only when accessed
+class CompiledPool(Sequence):
+    def __init__(self, buf, source=None):
+        self.source = source
+        self._buf = buf
+        if len(buf) < HEADER.size:
+            raise ValueError("cache too small")
+        (magic, version, self.mtime_ns, self.size, self.digest,
+         n_questions, n_strings, blob_size) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a question cache or wrong version")
+
+        pos = HEADER.size
+        self._offsets, pos = self._table("I", pos, n_strings + 1)
+        self._first, pos = self._table("I", pos, n_questions + 1)
+        self._correct, pos = self._table("b", pos, n_questions)
+        self._blob = pos
+        if pos + blob_size != len(buf) or self._offsets[-1] != blob_size or self._first[-1] != n_strings:
+            raise ValueError("truncated or corrupt cache")
+
+    @classmethod
+    def open(cls, path, source=None):
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buf, source)
+
+    def _table(self, typecode, pos, count):
+        table = array(typecode)
+        end = pos + count * table.itemsize
+        if end > len(self._buf):
+            raise ValueError("truncated cache table")
+        table.frombytes(self._buf[pos:end])
+        if NEEDS_SWAP:
+            table.byteswap()
+        return table, end
+
+    def text(self, k):
+        start = self._blob + self._offsets[k]
+        return self._buf[start:self._blob + self._offsets[k + 1]].decode("utf-8")
+
+    def qid(self, i):
+        return self.text(self._first[i])
+
+    def question(self, i):
+        return self.text(self._first[i] + 1)
+
+    def refs(self, i):
+        return self.text(self._first[i] + 2)
+
+    def answers(self, i):
+        return [self.text(k) for k in range(self._first[i] + FIXED_FIELDS, self._first[i + 1])]
+
+    def correct(self, i):
+        return self._correct[i]
+
+    def answer_count(self, i):
+        return self._first[i + 1] - self._first[i] - FIXED_FIELDS
+
+    def __len__(self):
+        return len(self._correct)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("question index out of range")
+        return {
+            "id": self.qid(i),
+            "correct": self._correct[i],
+            "refs": self.refs(i),
+            "question": self.question(i),
+            "answers": self.answers(i),
+        }
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+# Rewrite only the header's mtime/size after the source was touched but not changed
+def _refresh_header(path, pool, st):
+    with open(path, "r+b") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, st.st_mtime_ns, st.st_size, pool.digest,
+                            len(pool), len(pool._offsets) - 1, pool._offsets[-1]))
+
+# Open the cache for a pool, rebuilding it only when the source JSON changed
+def load_pool(json_path):
+    st = os.stat(json_path)
+    path = cache_path(json_path)
+    try:
+        pool = CompiledPool.open(path, json_path)
+        if pool.mtime_ns == st.st_mtime_ns and pool.size == st.st_size:
+            return pool
+        if pool.size == st.st_size and pool.digest == file_digest(json_path):
+            pool.close()
+            _refresh_header(path, pool, st)
+            return CompiledPool.open(path, json_path)
+        pool.close()
+    except (OSError, ValueError) as e:
+        if os.path.exists(path):
+            logging.warning(f"Rebuilding cache {path}: {e}")
+
+    try:
+        compile_pool(json_path)
+        return CompiledPool.open(path, json_path)
+    except OSError as e:
+        # Read-only directory: keep the compiled form in memory for this run
+        logging.warning(f"Could not write cache {path}: {e}")
+        with open(json_path, "rb") as f:
+            raw = f.read()
+        return CompiledPool(compile_bytes(json.loads(raw), st.st_mtime_ns, st.st_size,
+                                          hashlib.sha256(raw).digest()), json_path)
+
+# Bring the cache up to date after a sync from the pool the sync already parsed and hashed, so
+# the new file is never read again. Unless only formatting changed, the cache is recompiled in
+# full: every string after the first changed question moves, and compiling costs about as much
+# as the JSON parse the diff needed anyway
+def update_pool(json_path, diff):
+    st = os.stat(json_path)
+    digest = diff.digest
+    path = cache_path(json_path)
+    if not diff and not diff.reordered and diff.old_digest is not None:
+        # Same questions in the same order (only formatting changed): just re-stamp the header
+        try:
+            pool = CompiledPool.open(path, json_path)
+            pool.close()
+            if pool.digest == diff.old_digest:
+                pool.digest = digest
+                _refresh_header(path, pool, st)
+                return CompiledPool.open(path, json_path)
+        except (OSError, ValueError):
+            pass
+    ham_sync.atomic_write(path, compile_bytes(diff.questions, st.st_mtime_ns, st.st_size, digest))
+    return CompiledPool.open(path, json_path)
+
+# Compare json.load against opening the compiled cache, through to the first question
+def benchmark(json_paths, rounds=50):
+    print(f"{'pool':<18}{'json.load':>12}{'cache':>12}{'speedup':>10}")
+    for json_path in json_paths:
+        load_pool(json_path).close()  # make sure the cache is warm
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            with open(json_path, "r", encoding="utf-8") as f:
+                json.load(f)[0]
+        cold = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            pool = load_pool(json_path)
+            pool[0]
+            pool.close()
+        warm = (time.perf_counter() - start) / rounds
+
+        print(f"{json_path:<18}{cold * 1000:>10.3f}ms{warm * 1000:>10.3f}ms{cold / warm:>9.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or benchmark the compiled question pool caches.")
+    parser.add_argument("pools", nargs="*", default=["technician.json", "general.json", "extra.json"])
+    parser.add_argument("--benchmark", action="store_true", help="Compare JSON parsing with cached loading.")
+    parser.add_argument("--rounds", type=int, default=50, help="Benchmark repetitions per pool.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.pools, args.rounds)
+        return
+    for json_path in args.pools:
+        compile_pool(json_path)
+        print(f"Compiled {json_path} -> {cache_path(json_path)}")
+
+if __name__ == "__main__":
+    main()
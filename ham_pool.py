@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# Description: Shared, indexed HAM exam question pools for the CLI and GUI front ends.
+# Usage: import ham_pool; pool = ham_pool.load_questions("Technician"); pool.select("T1A")
+#        python3 ham_pool.py --benchmark
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import os
+import re
+import time
+import random
+import logging
+import argparse
+import ham_sync
+import ham_cache
+import ham_search
+import ham_srs
+
+# URLs to download the latest official HAM exam question pools from GitHub
+URLS = {
+    "Technician": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/technician-2022-2026/technician.json",
+    "General": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/general-2023-2027/general.json",
+    "Extra": "https://raw.githubusercontent.com/russolsen/ham_radio_question_pool/master/extra-2024-2028/extra.json"
+}
+
+# Corresponding local filenames for each question pool
+LOCAL_FILES = {
+    "Technician": "technician.json",
+    "General": "general.json",
+    "Extra": "extra.json"
+}
+
+# First letter of every question id in each pool (T1A01, G2E03, E7B11, ...)
+PREFIXES = {
+    "T": "Technician",
+    "G": "General",
+    "E": "Extra"
+}
+
+# FCC exams draw one question from every group; passing is 74%
+EXAM_SIZES = {
+    "Technician": 35,
+    "General": 35,
+    "Extra": 50
+}
+
+PASSING_SCORES = {
+    "Technician": 26,
+    "General": 26,
+    "Extra": 37
+}
+
+# Question ids look like T1A01: subelement T1, group T1A, number 01
+ID_PATTERN = re.compile(r"^[TGE]\d[A-Z]\d{2}$")
+
+# One question; the texts are decoded from the compiled cache only when read
+class Question:
+    __slots__ = ("id", "correct", "subelement", "group", "_source", "_index")
+
+    def __init__(self, qid, correct, source, index):
+        self.id = qid
+        self.correct = correct
+        self.subelement = qid[:2]
+        self.group = qid[:3]
+        self._source = source
+        self._index = index
+
+    @property
+    def question(self):
+        return self._source.question(self._index)
+
+    @property
+    def answers(self):
+        return self._source.answers(self._index)
+
+    @property
+    def refs(self):
+        return self._source.refs(self._index)
+
+    def __repr__(self):
+        return f"Question({self.id})"
+
+# A loaded pool with its questions indexed by id, group and subelement
+class QuestionPool:
+    __slots__ = ("name", "questions", "by_id", "by_group", "by_subelement", "groups", "source", "_index")
+
+    def __init__(self, name, questions=(), source=None):
+        self.name = name
+        self.questions = tuple(questions)
+        self.source = source
+        self._index = None
+        self.by_id = {}
+        by_group = {}
+        by_subelement = {}
+        for q in self.questions:
+            self.by_id[q.id] = q
+            by_group.setdefault(q.group, []).append(q)
+            by_subelement.setdefault(q.subelement, []).append(q)
+        self.by_group = {k: tuple(v) for k, v in by_group.items()}
+        self.by_subelement = {k: tuple(v) for k, v in by_subelement.items()}
+        self.groups = tuple(self.by_group.values())
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def __getitem__(self, i):
+        return self.questions[i]
+
+    # Questions matching a subelement (T1), group (T1A) or id (T1A01); empty if unknown
+    def select(self, key=None):
+        if not key:
+            return self.questions
+        key = key.strip().upper()
+        if len(key) == 2:
+            return self.by_subelement.get(key, ())
+        if len(key) == 3:
+            return self.by_group.get(key, ())
+        q = self.by_id.get(key)
+        return (q,) if q else ()
+
+    # Questions matching a search query (see ham_search); the index is loaded on first use
+    def search(self, query):
+        if self.source is None:
+            return ()
+        if self._index is None:
+            self._index = ham_search.load_index(LOCAL_FILES[self.name], self.source)
+        matches = [self.by_id[qid] for qid in self._index.search(query) if qid in self.by_id]
+        matches.sort(key=lambda q: q._index)  # pool order
+        return tuple(matches)
+
+    # One random question from each group, in group order
+    def build_exam(self, rng=random):
+        return [rng.choice(group) for group in self.groups]
+
+    # Exam number i of a batch is reproducible on its own from (seed, i)
+    def exam_for(self, seed, number):
+        return self.build_exam(random.Random(seed * 1000003 + number))
+
+    def generate_exams(self, count, seed=0):
+        for number in range(count):
+            yield number, self.exam_for(seed, number)
+
+# Pool name for a selection key such as "E7" or "G2E", or None
+def pool_for_key(key):
+    return PREFIXES.get(key.strip()[:1].upper()) if key else None
+
+# Build the indexed pool from the compiled cache, validating each question once
+def build_pool(name, source):
+    questions = []
+    seen = set()
+    for i in range(len(source)):
+        qid = source.qid(i)
+        if not ID_PATTERN.match(qid):
+            logging.warning(f"Skipping question with malformed id: {qid}")
+            continue
+        if qid in seen:
+            logging.warning(f"Skipping duplicate question id: {qid}")
+            continue
+        if source.answer_count(i) < 2:
+            logging.warning(f"Skipping question with fewer than two answers: {qid}")
+            continue
+        seen.add(qid)
+        questions.append(Question(qid, source.correct(i), source, i))
+    return QuestionPool(name, questions, source)
+
+# One-line description of a ham_sync.SyncResult
+def describe_sync(result):
+    if result.status == "updated":
+        diff = result.diff
+        changes = f", {len(diff.added)} added, {len(diff.removed)} removed, {len(diff.changed)} changed" if diff else ""
+        return f"{result.path} updated ({result.bytes:,} bytes in {result.elapsed:.2f}s{changes})."
+    if result.status == "unchanged":
+        return f"{result.path} is up to date."
+    if os.path.exists(result.path):
+        return f"Skipping update for {result.name} (sync failed)."
+    return f"No local file for {result.name} and the download failed."
+
+# Bring the derived state of a freshly downloaded pool up to date from its id-level diff:
+# the compiled cache (no re-parse), the search index and saved progress for changed ids only
+def apply_update(test_name, diff):
+    json_path = LOCAL_FILES[test_name]
+    source = ham_cache.update_pool(json_path, diff)
+    if diff:
+        ham_search.update_index(json_path, source, diff)
+        # Progress survives a refs-only edit, but not a changed question, answer or key
+        stale = diff.removed + [qid for qid in diff.changed
+                                if any(diff.old[qid].get(k) != diff.new[qid].get(k) for k in ("question", "answers", "correct"))]
+        ham_srs.forget(stale)
+    elif diff.old_digest is not None:
+        # Same questions, new bytes: the index only needs re-stamping with the new digest
+        ham_search.update_index(json_path, source, diff)
+    return source
+
+# Sync all 3 test pools with the GitHub repo (if newer versions exist)
+# report receives a message as each pool finishes (print by default)
+def sync_files(report=print):
+    def progress(result):
+        if result.status == "updated":
+            try:
+                apply_update(result.name, result.diff)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not update caches for {result.name}: {e}")
+        report(describe_sync(result))
+    return ham_sync.sync_files(URLS, LOCAL_FILES, progress=progress)
+
+# Search every local pool; returns (pool name, question) pairs
+def search(query, test_names=None):
+    results = []
+    for test_name in test_names or LOCAL_FILES:
+        pool = load_questions(test_name)
+        results.extend((test_name, q) for q in pool.search(query))
+    return results
+
+# Load and index a question pool from the locally stored file (via its compiled cache)
+def load_questions(test_name):
+    local_path = LOCAL_FILES[test_name]
+    if not os.path.exists(local_path):
+        print(f"Error: Local file {local_path} not found.")
+        return QuestionPool(test_name)
+    return build_pool(test_name, ham_cache.load_pool(local_path))
+
+# Time exam generation for every pool
+def benchmark(count=10000):
+    print(f"{'pool':<12}{'groups':>8}{'exams/s':>14}{'per exam':>12}")
+    for test_name in LOCAL_FILES:
+        pool = load_questions(test_name)
+        start = time.perf_counter()
+        for _ in pool.generate_exams(count, seed=1):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{test_name:<12}{len(pool.groups):>8}{count / elapsed:>14,.0f}{elapsed / count * 1e6:>10.1f}us")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared question pools.")
+    parser.add_argument("--benchmark", action="store_true", help="Measure exams generated per second.")
+    parser.add_argument("--count", type=int, default=10000, help="Exams to generate per pool.")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.count)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+# Description: I/O-free quiz engine for the HAM exam front ends, plus a headless session runner.
+# Usage: import ham_quiz; session = ham_quiz.QuizSession(questions); p = session.next(); session.answer("A")
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import time
+import random
+from array import array
+import ham_pool
+
+# A question as shown to the user: answers shuffled and lettered A, B, C, ...
+class Presented:
+    __slots__ = ("question", "options", "correct_letter")
+
+    def __init__(self, question, options):
+        self.question = question
+        self.options = options  # [(letter, original answer index, answer text), ...]
+        self.correct_letter = next(letter for letter, i, _ in options if i == question.correct)
+
+    def is_correct(self, letter):
+        return letter == self.correct_letter
+
+    @property
+    def correct_answer(self):
+        return self.question.answers[self.question.correct]
+
+# Shuffle a question's answers and letter them
+def present(q, rng=random):
+    options = list(enumerate(q.answers))
+    rng.shuffle(options)
+    return Presented(q, [(chr(65 + idx), i, text) for idx, (i, text) in enumerate(options)])
+
+# Walks a list of questions in random order and keeps score
+class QuizSession:
+    __slots__ = ("questions", "order", "position", "score", "total", "rng", "current")
+
+    def __init__(self, questions, rng=random, shuffle=True):
+        self.questions = questions
+        self.order = list(range(len(questions)))
+        if shuffle:
+            rng.shuffle(self.order)
+        self.position = 0
+        self.score = 0
+        self.total = 0
+        self.rng = rng
+        self.current = None
+
+    # Present the next question, or None when the session is over
+    def next(self):
+        if self.position >= len(self.order):
+            self.current = None
+            return None
+        self.current = present(self.questions[self.order[self.position]], self.rng)
+        self.position += 1
+        return self.current
+
+    # Score a letter for the current question; raises ValueError for an invalid letter
+    def answer(self, letter):
+        if self.current is None or letter not in {o[0] for o in self.current.options}:
+            raise ValueError(f"Invalid answer: {letter!r}")
+        correct = self.current.is_correct(letter)
+        self.total += 1
+        self.score += correct
+        self.current = None
+        return correct
+
+# --- Headless answer sources: called with a Presented question, return a letter or 'Q' ---
+
+# Replays one session's letters from a script; running out (or 'Q') ends the session
+class ScriptedAnswers:
+    def __init__(self, tokens):
+        self.tokens = [t.upper() for t in tokens]
+        self.position = 0
+
+    def __call__(self, presented):
+        if self.position >= len(self.tokens):
+            return "Q"
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+# Split a whole answer script into per-session segments: 'Q' ends one session and the letters
+# after it belong to the next
+def split_script(tokens):
+    segments = [[]]
+    for token in tokens:
+        if token.upper() == "Q":
+            segments.append([])
+        else:
+            segments[-1].append(token)
+    return segments
+
+# A student who knows each question with probability skill and guesses otherwise
+class SimulatedStudent:
+    def __init__(self, skill=0.75, rng=random):
+        self.skill = skill
+        self.rng = rng
+
+    def __call__(self, presented):
+        if self.rng.random() < self.skill:
+            return presented.correct_letter
+        return self.rng.choice(presented.options)[0]
+
+# Run one session against an answer source; per-question engine latencies are appended to
+# latencies. An answer that isn't one of the question's letters ends the session and is
+# returned as the problem, else None
+def run_session(questions, answerer, rng, latencies):
+    session = QuizSession(questions, rng)
+    problem = None
+    while True:
+        start = time.perf_counter()
+        presented = session.next()
+        if presented is None:
+            break
+        letter = answerer(presented)
+        if letter == "Q":
+            break
+        try:
+            session.answer(letter)
+        except ValueError:
+            problem = f"invalid answer {letter!r} to {presented.question.id}"
+            break
+        latencies.append(time.perf_counter() - start)
+    return session.score, session.total, problem
+
+# Run sessions [first, first + count) of a seeded batch; used directly and by process pool workers.
+# Session n of a script answers from the script's nth 'Q'-separated segment. Returns
+# (score, total, latencies, [problem messages])
+def run_sessions(test_name, only, first, count, seed, script=None, skill=0.75):
+    questions = ham_pool.load_questions(test_name).select(only)
+    segments = split_script(script) if script is not None else None
+    latencies = array("d")
+    score = total = 0
+    problems = []
+    for number in range(first, first + count):
+        rng = random.Random(seed * 1000003 + number)
+        if segments is not None:
+            answerer = ScriptedAnswers(segments[number] if number < len(segments) else [])
+        else:
+            answerer = SimulatedStudent(skill, rng)
+        s, t, problem = run_session(questions, answerer, rng, latencies)
+        score += s
+        total += t
+        if problem:
+            problems.append(f"Session {number + 1}: {problem}; session ended")
+    return score, total, latencies, problems
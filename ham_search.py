@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+# Description: Inverted-index full-text search over the HAM exam question pools.
+# Usage: python3 ham_search.py [--benchmark] <query>
+#        Queries: words are ANDed, "quoted phrases" match in order, swr* matches a prefix.
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import os
+import re
+import sys
+import time
+import bisect
+import marshal
+import logging
+import argparse
+import ham_sync
+import ham_cache
+
+# Index files live next to their pool: technician.json -> technician.qindex
+INDEX_SUFFIX = ".qindex"
+
+MAGIC = b"HQI1"
+
+# Python version the index was marshalled with; marshal is not portable across versions
+FORMAT = (1, marshal.version, sys.version_info[:2])
+
+# Words, numbers and rule references such as 97.305 or 2.4-ghz
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+# Gap left between indexed fields so phrases never span question, answers and refs
+FIELD_GAP = 1000
+
+def index_path(json_path):
+    return os.path.splitext(json_path)[0] + INDEX_SUFFIX
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+# Indexed fields of a question given as a JSON dict
+def document_texts(q):
+    return [q.get("question") or ""] + list(q.get("answers") or []) + [q.get("refs") or ""]
+
+# Token -> positions for one document, with a gap between fields
+def token_positions(texts):
+    positions = {}
+    position = 0
+    for text in texts:
+        for token in tokenize(text):
+            positions.setdefault(token, []).append(position)
+            position += 1
+        position += FIELD_GAP
+    return positions
+
+# Positional inverted index over one compiled pool: token -> {doc: (positions...)}
+class SearchIndex:
+    def __init__(self, ids, postings):
+        self.ids = ids  # doc -> question id; None for documents removed by update()
+        self.docs = {qid: doc for doc, qid in enumerate(ids) if qid is not None}
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+
+    @classmethod
+    def build(cls, source):
+        ids = []
+        postings = {}
+        for doc in range(len(source)):
+            ids.append(source.qid(doc))
+            texts = [source.question(doc)] + source.answers(doc) + [source.refs(doc)]
+            for token, found in token_positions(texts).items():
+                postings.setdefault(token, {})[doc] = tuple(found)
+        return cls(ids, postings)
+
+    def add(self, qid, texts):
+        doc = len(self.ids)
+        self.ids.append(qid)
+        self.docs[qid] = doc
+        for token, found in token_positions(texts).items():
+            docs = self.postings.get(token)
+            if docs is None:
+                docs = self.postings[token] = {}
+                bisect.insort(self.vocabulary, token)
+            docs[doc] = tuple(found)
+
+    # texts are the question's previously indexed fields, so only its own tokens are visited
+    def remove(self, qid, texts):
+        doc = self.docs.pop(qid, None)
+        if doc is None:
+            return
+        self.ids[doc] = None
+        for token in set(tokenize(" ".join(texts))):
+            docs = self.postings.get(token)
+            if docs is not None and docs.pop(doc, None) is not None and not docs:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    # Apply a ham_sync.PoolDiff; only removed, added and changed questions are touched
+    def update(self, diff):
+        for qid in diff.removed + diff.changed:
+            self.remove(qid, document_texts(diff.old[qid]))
+        for qid in diff.added + diff.changed:
+            self.add(qid, document_texts(diff.new[qid]))
+
+    # Removed documents leave holes in the doc numbering; rebuild once they dominate
+    def fragmented(self):
+        return len(self.ids) > 2 * max(1, len(self.docs))
+
+    # Documents containing any token that starts with prefix
+    def _prefix_docs(self, prefix):
+        docs = set()
+        i = bisect.bisect_left(self.vocabulary, prefix)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix):
+            docs.update(self.postings[self.vocabulary[i]])
+            i += 1
+        return docs
+
+    # Documents containing the tokens at consecutive positions
+    def _phrase_docs(self, tokens):
+        lists = [self.postings.get(t) for t in tokens]
+        if not all(lists):
+            return set()
+        docs = set(min(lists, key=len))
+        for postings in lists:
+            docs.intersection_update(postings)
+        matches = set()
+        for doc in docs:
+            starts = set(lists[0][doc])
+            for offset, postings in enumerate(lists[1:], start=1):
+                starts.intersection_update(p - offset for p in postings[doc])
+                if not starts:
+                    break
+            if starts:
+                matches.add(doc)
+        return matches
+
+    # Matching question ids, in indexing order
+    def search(self, query):
+        result = None
+        for phrase, word in QUERY_PATTERN.findall(query):
+            if phrase:
+                docs = self._phrase_docs(tokenize(phrase))
+            elif word.endswith("*"):
+                tokens = tokenize(word[:-1])
+                docs = self._prefix_docs(tokens[0]) if len(tokens) == 1 else set()
+            else:
+                tokens = tokenize(word)
+                docs = self._phrase_docs(tokens) if tokens else None
+            if docs is None:
+                continue
+            result = docs if result is None else result & docs
+            if not result:
+                return []
+        return [self.ids[doc] for doc in sorted(result or ())]
+
+    def dump(self, path, digest):
+        ham_sync.atomic_write(path, MAGIC + marshal.dumps((FORMAT, digest, self.ids, self.postings)))
+
+# Read a saved index if it was built for the pool with the given source digest
+def read_index(path, expected_digest):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:len(MAGIC)] == MAGIC:
+            fmt, digest, ids, postings = marshal.loads(data[len(MAGIC):])
+            if fmt == FORMAT and digest == expected_digest:
+                return SearchIndex(ids, postings)
+    except (OSError, ValueError, EOFError, TypeError) as e:
+        if os.path.exists(path):
+            logging.warning(f"Rebuilding index {path}: {e}")
+    return None
+
+def _save(index, path, digest):
+    try:
+        index.dump(path, digest)
+    except OSError as e:
+        logging.warning(f"Could not write index {path}: {e}")
+
+# Load the index cached next to a pool, rebuilding it when the pool's source changed
+def load_index(json_path, source=None):
+    source = source or ham_cache.load_pool(json_path)
+    path = index_path(json_path)
+    index = read_index(path, source.digest)
+    if index is None:
+        index = SearchIndex.build(source)
+        _save(index, path, source.digest)
+    return index
+
+# Patch the saved index after a sync (see ham_sync.PoolDiff) instead of rebuilding it
+def update_index(json_path, source, diff):
+    path = index_path(json_path)
+    index = read_index(path, diff.old_digest) if diff.old_digest else None
+    if index is None or index.fragmented():
+        index = SearchIndex.build(source)
+    else:
+        index.update(diff)
+    _save(index, path, source.digest)
+    return index
+
+# Time a set of queries against every pool's index
+def benchmark(json_paths, queries, rounds=1000):
+    indexes = [load_index(p) for p in json_paths]
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            hits = [qid for index in indexes for qid in index.search(query)]
+        elapsed = (time.perf_counter() - start) / rounds
+        print(f"{query!r:<28}{len(hits):>6} hits{elapsed * 1e6:>10.1f}us")
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the question pools.")
+    parser.add_argument("query", nargs="*", help='Words, "phrases" and prefix* terms.')
+    parser.add_argument("--pools", nargs="+", default=["technician.json", "general.json", "extra.json"])
+    parser.add_argument("--benchmark", action="store_true", help="Time some sample queries.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.pools, [" ".join(args.query)] if args.query else
+                  ["swr", "97.305", "ant*", '"standing wave ratio"', "repeater offset"])
+        return
+    query = " ".join(args.query)
+    for json_path in args.pools:
+        source = ham_cache.load_pool(json_path)
+        for qid in load_index(json_path, source).search(query):
+            print(qid)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/python3
+# Description: Multi-user asyncio HTTP quiz server for the HAM exam pools, with a load-test client.
+# Usage: python3 ham_server.py [--host 0.0.0.0] [--port 8073]
+#        python3 ham_server.py --load-test [--clients 300] [--sessions 1000] [--url http://127.0.0.1:8073]
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+#
+# API (JSON over HTTP/1.1 keep-alive):
+#   POST   /session               {"test": "Technician", "mode": "quiz|exam", "only": "T1A", "seed": 1}
+#   GET    /session/<id>          current question
+#   POST   /session/<id>/answer   {"answer": "B"} -> result and the next question
+#   DELETE /session/<id>
+#   GET    /stats
+
+import json
+import time
+import random
+import asyncio
+import logging
+import secrets
+import argparse
+from array import array
+from urllib.parse import urlsplit
+import ham_pool
+
+DEFAULT_PORT = 8073
+
+# Sessions idle for longer than this are dropped
+SESSION_TTL = 3600
+
+MAX_HEADER_BYTES = 16384
+MAX_BODY_BYTES = 65536
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# One quiz-taker. Questions are positions in the shared pool; the current question's
+# answer shuffle is kept as a small bytes permutation
+class ServerSession:
+    __slots__ = ("pool", "order", "position", "score", "total", "permutation", "last_seen")
+
+    def __init__(self, pool, order, rng):
+        self.pool = pool
+        self.order = order
+        self.position = 0
+        self.score = 0
+        self.total = 0
+        self.permutation = b""
+        self.last_seen = time.monotonic()
+        self.shuffle(rng)
+
+    def current(self):
+        return self.pool.questions[self.order[self.position]] if self.position < len(self.order) else None
+
+    def shuffle(self, rng):
+        q = self.current()
+        if q is not None:
+            perm = bytearray(range(len(q.answers)))
+            rng.shuffle(perm)
+            self.permutation = bytes(perm)
+
+    def question_json(self):
+        q = self.current()
+        if q is None:
+            return None
+        answers = q.answers
+        return {
+            "id": q.id,
+            "number": self.position + 1,
+            "of": len(self.order),
+            "question": q.question,
+            "options": [{"letter": chr(65 + slot), "text": answers[i]} for slot, i in enumerate(self.permutation)],
+        }
+
+    def answer(self, letter, rng):
+        q = self.current()
+        if q is None:
+            raise HTTPError(400, "session is finished")
+        slot = ord(letter) - 65 if isinstance(letter, str) and len(letter) == 1 else -1
+        if not 0 <= slot < len(self.permutation):
+            raise HTTPError(400, f"invalid answer: {letter!r}")
+        correct = self.permutation[slot] == q.correct
+        correct_letter = chr(65 + self.permutation.index(q.correct))
+        self.total += 1
+        self.score += correct
+        self.position += 1
+        self.shuffle(rng)
+        return correct, correct_letter
+
+# Shared pools plus the session table; all request handling runs on one event loop
+class QuizServer:
+    def __init__(self, pools):
+        self.pools = pools  # {test name: QuestionPool}, loaded once and shared by every session
+        self.positions = {name: {q.id: i for i, q in enumerate(pool.questions)} for name, pool in pools.items()}
+        self.sessions = {}
+        self.rng = random.Random()
+        self.requests = 0
+
+    def create_session(self, body):
+        name = body.get("test", "Technician")
+        only = body.get("only")
+        if not isinstance(name, str):
+            raise HTTPError(400, "test must be a string")
+        if only is not None and not isinstance(only, str):
+            raise HTTPError(400, "only must be a string or null")
+        if "seed" in body and (isinstance(body["seed"], bool) or not isinstance(body["seed"], (int, str))):
+            raise HTTPError(400, "seed must be an integer or a string")
+        pool = self.pools.get(name)
+        if pool is None or not len(pool):
+            raise HTTPError(400, f"unknown or empty pool: {name!r}")
+        rng = random.Random(body["seed"]) if "seed" in body else self.rng
+        if body.get("mode") == "exam":
+            questions = pool.build_exam(rng)
+        else:
+            questions = list(pool.select(only))
+            rng.shuffle(questions)
+        if not questions:
+            raise HTTPError(400, "no questions match the selection")
+        positions = self.positions[name]
+        order = array("H", [positions[q.id] for q in questions])
+
+        session_id = secrets.token_hex(8)
+        session = self.sessions[session_id] = ServerSession(pool, order, rng)
+        return 201, {"session": session_id, "question": session.question_json()}
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, "no such session")
+        session.last_seen = time.monotonic()
+        return session
+
+    def route(self, method, path, body):
+        self.requests += 1
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if parts == ["session"] and method == "POST":
+            return self.create_session(body)
+        if parts == ["stats"] and method == "GET":
+            return 200, {"sessions": len(self.sessions), "requests": self.requests,
+                         "pools": {name: len(pool) for name, pool in self.pools.items()}}
+        if len(parts) == 2 and parts[0] == "session":
+            if method == "GET":
+                session = self.get_session(parts[1])
+                return 200, {"question": session.question_json(), "score": session.score, "total": session.total}
+            if method == "DELETE":
+                self.get_session(parts[1])
+                del self.sessions[parts[1]]
+                return 200, {"deleted": parts[1]}
+            raise HTTPError(405, "method not allowed")
+        if len(parts) == 3 and parts[0] == "session" and parts[2] == "answer" and method == "POST":
+            session = self.get_session(parts[1])
+            correct, correct_letter = session.answer(body.get("answer"), self.rng)
+            return 200, {"correct": correct, "correct_letter": correct_letter,
+                         "score": session.score, "total": session.total, "next": session.question_json()}
+        raise HTTPError(404, "not found")
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await send_response(writer, 413, {"error": "headers too large"}, keep_alive=False)
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, path, version = request_line.split(" ", 2)
+                except ValueError:
+                    await send_response(writer, 400, {"error": "bad request line"}, keep_alive=False)
+                    break
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+
+                length = headers.get("content-length") or "0"
+                if not (length.isascii() and length.isdigit()):
+                    await send_response(writer, 400, {"error": "invalid Content-Length"}, keep_alive=False)
+                    break
+                length = int(length)
+                if length > MAX_BODY_BYTES:
+                    await send_response(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    break
+                raw = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                try:
+                    body = json.loads(raw) if raw else {}
+                    if not isinstance(body, dict):
+                        raise HTTPError(400, "body must be a JSON object")
+                    status, payload = self.route(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    status, payload = 400, {"error": f"invalid JSON: {e}"}
+                except Exception:
+                    # A bug in one request must not take the connection down without an answer
+                    logging.exception(f"{method} {path} failed")
+                    status, payload = 500, {"error": "internal error"}
+                await send_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Drop idle sessions every minute
+    async def reap_sessions(self):
+        while True:
+            await asyncio.sleep(60)
+            cutoff = time.monotonic() - SESSION_TTL
+            for session_id in [k for k, s in self.sessions.items() if s.last_seen < cutoff]:
+                del self.sessions[session_id]
+
+async def send_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+async def serve(host, port):
+    pools = {name: ham_pool.load_questions(name) for name in ham_pool.LOCAL_FILES}
+    server = QuizServer(pools)
+    listener = await asyncio.start_server(server.handle_client, host, port, limit=MAX_HEADER_BYTES)
+    print(f"Serving {', '.join(f'{n} ({len(p)})' for n, p in pools.items())} on http://{host}:{port}")
+    reaper = asyncio.ensure_future(server.reap_sessions())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        reaper.cancel()
+
+# --- Load-test client ---
+
+# Minimal keep-alive JSON client over one connection
+class Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        length = 0
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":", 1)[1])
+        data = json.loads(await self.reader.readexactly(length)) if length else {}
+        if status >= 400:
+            raise RuntimeError(f"{method} {path}: {status} {data.get('error')}")
+        return data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+# One virtual quiz-taker: runs exam sessions back to back until the shared quota is used up
+async def virtual_user(host, port, quota, latencies, test_name):
+    connection = Connection(host, port)
+    rng = random.Random()
+    try:
+        while quota[0] > 0:
+            quota[0] -= 1
+            created = await connection.request("POST", "/session", {"test": test_name, "mode": "exam"})
+            session_id, question = created["session"], created["question"]
+            while question is not None:
+                letters = [o["letter"] for o in question["options"]]
+                start = time.perf_counter()
+                result = await connection.request("POST", f"/session/{session_id}/answer",
+                                                  {"answer": rng.choice(letters)})
+                latencies.append(time.perf_counter() - start)
+                question = result["next"]
+            await connection.request("DELETE", f"/session/{session_id}")
+    finally:
+        connection.close()
+
+async def load_test(url, clients, sessions, test_name):
+    parts = urlsplit(url)
+    host, port = parts.hostname or "127.0.0.1", parts.port or DEFAULT_PORT
+    latencies = array("d")
+    quota = [sessions]
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(host, port, quota, latencies, test_name) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    print(f"{clients} clients, {sessions:,} {test_name} exam sessions in {elapsed:.2f}s")
+    print(f"Sessions/s: {sessions / elapsed:,.1f}   answers/s: {len(ordered) / elapsed:,.0f}")
+    if ordered:
+        p50 = ordered[len(ordered) // 2]
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        print(f"Answer submit latency: p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms")
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format='[%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Multi-user HAM quiz server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--load-test", action="store_true", help="Run the load-test client instead of serving.")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}", help="Server to load-test.")
+    parser.add_argument("--clients", type=int, default=300, help="Concurrent virtual quiz-takers.")
+    parser.add_argument("--sessions", type=int, default=1000, help="Exam sessions to complete in total.")
+    parser.add_argument("--test", default="Technician", choices=list(ham_pool.LOCAL_FILES))
+    args = parser.parse_args()
+
+    try:
+        if args.load_test:
+            asyncio.run(load_test(args.url, args.clients, args.sessions, args.test))
+        else:
+            asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
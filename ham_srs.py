@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+# Description: SM-2 spaced-repetition scheduling with per-question history in SQLite.
+# Usage: import ham_srs; s = ham_srs.Scheduler(questions); q = s.next(); s.record(q, True)
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import os
+import time
+import heapq
+import random
+import sqlite3
+from collections import deque
+
+# Local progress database, keyed by question id
+DB_FILE = "ham-progress.db"
+
+DAY = 86400.0
+
+# SM-2 parameters
+START_EASE = 2.5
+MIN_EASE = 1.3
+
+# A missed question comes back after this many seconds (within the same session)
+RELEARN_DELAY = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    qid      TEXT PRIMARY KEY,
+    ease     REAL NOT NULL,
+    interval REAL NOT NULL,
+    reps     INTEGER NOT NULL,
+    lapses   INTEGER NOT NULL,
+    due      REAL NOT NULL,
+    last     REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id      INTEGER PRIMARY KEY,
+    qid     TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    correct INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_qid ON attempts (qid, ts);
+"""
+
+def connect(db_path=DB_FILE):
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+# Drop the saved scheduling of the given question ids (their attempt history is kept);
+# every other id keeps its progress untouched
+def forget(qids, db_path=DB_FILE):
+    if not qids or not os.path.exists(db_path):
+        return 0
+    db = connect(db_path)
+    try:
+        with db:
+            return db.executemany("DELETE FROM cards WHERE qid = ?", [(qid,) for qid in qids]).rowcount
+    finally:
+        db.close()
+
+# Scheduling state of one question
+class Card:
+    __slots__ = ("qid", "ease", "interval", "reps", "lapses", "due", "last")
+
+    def __init__(self, qid, ease=START_EASE, interval=0.0, reps=0, lapses=0, due=0.0, last=0.0):
+        self.qid = qid
+        self.ease = ease
+        self.interval = interval
+        self.reps = reps
+        self.lapses = lapses
+        self.due = due
+        self.last = last
+
+    # SM-2 update; a correct answer counts as quality 4, a miss as quality 1
+    def review(self, correct, now):
+        quality = 4 if correct else 1
+        if correct:
+            self.reps += 1
+            if self.reps == 1:
+                self.interval = 1.0
+            elif self.reps == 2:
+                self.interval = 6.0
+            else:
+                self.interval *= self.ease
+            self.due = now + self.interval * DAY
+        else:
+            self.reps = 0
+            self.lapses += 1
+            self.interval = 0.0
+            self.due = now + RELEARN_DELAY
+        self.ease = max(MIN_EASE, self.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        self.last = now
+
+    def row(self):
+        return (self.qid, self.ease, self.interval, self.reps, self.lapses, self.due, self.last)
+
+# Picks the next question from a due-date heap instead of rescanning the pool
+class Scheduler:
+    def __init__(self, questions, db_path=DB_FILE, clock=time.time):
+        self.db = connect(db_path)
+        self.clock = clock
+        self.by_id = {q.id: q for q in questions}
+        self.cards = {}
+        self.heap = []
+
+        for row in self.db.execute("SELECT qid, ease, interval, reps, lapses, due, last FROM cards"):
+            if row[0] in self.by_id:
+                card = Card(*row)
+                self.cards[card.qid] = card
+                self.heap.append((card.due, card.qid))
+        heapq.heapify(self.heap)
+
+        unseen = [qid for qid in self.by_id if qid not in self.cards]
+        random.shuffle(unseen)
+        self.new = deque(unseen)
+
+    # Drop heap entries left behind by earlier reviews of the same card
+    def _top(self):
+        while self.heap:
+            due, qid = self.heap[0]
+            if self.cards[qid].due == due:
+                return due, qid
+            heapq.heappop(self.heap)
+        return None
+
+    # Next question: overdue reviews first, then unseen questions; None when nothing is due
+    def next(self):
+        top = self._top()
+        if top and top[0] <= self.clock():
+            return self.by_id[top[1]]
+        if self.new:
+            return self.by_id[self.new[0]]
+        return None
+
+    # Earliest time a reviewed question becomes due, or None
+    def next_due(self):
+        top = self._top()
+        return top[0] if top else None
+
+    def record(self, question, correct):
+        now = self.clock()
+        card = self.cards.get(question.id)
+        if card is None:
+            card = self.cards[question.id] = Card(question.id)
+            if self.new and self.new[0] == question.id:
+                self.new.popleft()
+            else:
+                try:
+                    self.new.remove(question.id)
+                except ValueError:
+                    pass
+        card.review(correct, now)
+        heapq.heappush(self.heap, (card.due, card.qid))
+
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?, ?, ?, ?)", card.row())
+            self.db.execute("INSERT INTO attempts (qid, ts, correct) VALUES (?, ?, ?)",
+                            (question.id, now, int(bool(correct))))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# Description: Per-question answer log (time taken and correctness) and a NumPy report by subelement and group.
+# Usage: import ham_stats; log = ham_stats.AttemptLog(); log.record("T1A01", True, 4.2)
+#        python3 ham_stats.py [--log FILE] [--benchmark N]
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import os
+import time
+import random
+import struct
+import logging
+import argparse
+import tempfile
+
+# Append-only binary log shared by the CLI and GUI
+LOG_FILE = "ham-attempts.log"
+
+# One fixed-size record per answer: timestamp, question id, correct, seconds taken
+RECORD = struct.Struct("<d5sBf")
+
+# The same layout as a NumPy structured dtype (packed, little-endian)
+DTYPE_FIELDS = [("ts", "<f8"), ("qid", "S5"), ("correct", "u1"), ("latency", "<f4")]
+
+# Appends one record per answered question. Each record is a single unbuffered write to a
+# file opened for appending, so a crash never leaves more than a partial last record
+class AttemptLog:
+    def __init__(self, path=LOG_FILE):
+        self.path = path
+        try:
+            self.file = open(path, "ab", buffering=0)
+        except OSError as e:
+            logging.warning(f"Not recording answers to {path}: {e}")
+            self.file = None
+
+    def record(self, qid, correct, latency, ts=None):
+        if self.file is None:
+            return
+        try:
+            self.file.write(RECORD.pack(time.time() if ts is None else ts, qid.encode("ascii"),
+                                        int(bool(correct)), latency))
+        except (OSError, UnicodeEncodeError, struct.error) as e:
+            logging.warning(f"Could not record answer to {qid}: {e}")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+# Load the whole log as a structured array (ignoring a partial trailing record)
+def read_log(path=LOG_FILE):
+    import numpy as np  # only the report needs NumPy
+    dtype = np.dtype(DTYPE_FIELDS)
+    if not os.path.exists(path):
+        return np.empty(0, dtype)
+    count = os.path.getsize(path) // dtype.itemsize
+    return np.fromfile(path, dtype=dtype, count=count)
+
+# Question ids as integers (their 5 ASCII bytes, big-endian): grouping then sorts numbers, not
+# strings, and the subelement (T1) and group (T1A) are just the top 2 and 3 bytes
+def id_codes(records):
+    import numpy as np
+    raw = np.ndarray((len(records), 5), np.uint8, buffer=records, offset=records.dtype.fields["qid"][1],
+                     strides=(records.dtype.itemsize, 1))
+    codes = np.zeros(len(records), np.int64)
+    for column in range(5):
+        codes = codes << 8 | raw[:, column]
+    return codes
+
+# Attempts, accuracy and median seconds per key; inverse maps every record to its key and
+# by_latency is the records' latency sort order, shared by every table
+def aggregate(names, inverse, correct, latency, by_latency):
+    import numpy as np
+    counts = np.bincount(inverse, minlength=len(names))
+    right = np.bincount(inverse, weights=correct, minlength=len(names))
+    # A stable sort by key keeps each key's latencies sorted (radix sort for small key types)
+    keys = inverse[by_latency].astype(np.uint16 if len(names) < 1 << 16 else np.int64)
+    ordered = latency[by_latency][np.argsort(keys, kind="stable")]
+    starts = np.cumsum(counts) - counts
+    last = np.maximum(counts - 1, 0)
+    medians = (ordered[starts + last // 2] + ordered[starts + (last + 1) // 2]) / 2
+    return [(name, int(n), r / n * 100, float(m)) for name, n, r, m in zip(names, counts, right, medians) if n]
+
+# Per-subelement and per-group rows: [(key, attempts, accuracy %, median seconds), ...]
+def summarize(records):
+    import numpy as np
+    if not len(records):
+        return [], []
+    # Group by question id once; subelements and groups are derived from the few unique ids
+    codes, by_qid = np.unique(id_codes(records), return_inverse=True)
+    correct = records["correct"]
+    latency = records["latency"]
+    by_latency = np.argsort(latency)
+    tables = []
+    for width in (2, 3):  # T1 subelement, T1A group
+        prefixes, by_prefix = np.unique(codes >> 8 * (5 - width), return_inverse=True)
+        names = [int(code).to_bytes(width, "big").decode("ascii", "replace") for code in prefixes]
+        tables.append(aggregate(names, by_prefix[by_qid], correct, latency, by_latency))
+    return tables[0], tables[1]
+
+def print_table(title, rows):
+    print(f"\n{title:<10}{'attempts':>10}{'accuracy':>10}{'median':>10}")
+    for key, attempts, accuracy, median in rows:
+        print(f"{key:<10}{attempts:>10,}{accuracy:>9.1f}%{median:>9.1f}s")
+
+# Print accuracy and median answer time per subelement and group
+def report(path=LOG_FILE):
+    start = time.perf_counter()
+    records = read_log(path)
+    subelements, groups = summarize(records)
+    elapsed = time.perf_counter() - start
+    if not len(records):
+        print(f"No answers recorded yet in {path}.")
+        return
+    print_table("Subelement", subelements)
+    print_table("Group", groups)
+    weakest = sorted(groups, key=lambda row: row[2])[:5]
+    print(f"\nWeakest groups: {', '.join(f'{key} ({accuracy:.0f}%)' for key, _, accuracy, _ in weakest)}")
+    print(f"{len(records):,} answers summarized in {elapsed * 1000:.1f} ms")
+
+# Time the report over a synthetic log of count random answers
+def benchmark(count):
+    import numpy as np
+    rng = random.Random(1)
+    qids = [f"{p}{s}{g}{n:02d}" for p in "TGE" for s in range(10) for g in "ABCDEF" for n in range(1, 12)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, LOG_FILE)
+        records = np.empty(count, np.dtype(DTYPE_FIELDS))
+        records["ts"] = time.time()
+        records["qid"] = [rng.choice(qids) for _ in range(count)]
+        records["correct"] = np.random.default_rng(1).random(count) < 0.75
+        records["latency"] = np.random.default_rng(2).gamma(2.0, 4.0, count)
+        records.tofile(path)
+
+        start = time.perf_counter()
+        subelements, groups = summarize(read_log(path))
+        elapsed = time.perf_counter() - start
+    print(f"{count:,} answers -> {len(subelements)} subelements, {len(groups)} groups in {elapsed * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Report answer accuracy and time per subelement and group.")
+    parser.add_argument("--log", default=LOG_FILE, help="Answer log to read.")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Time the report over N synthetic answers.")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        report(args.log)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# Description: Concurrent, conditional sync of the HAM exam question pools.
+# Usage: import ham_sync; ham_sync.sync_files(URLS, LOCAL_FILES)
+# Author: Justin Oros
+# Source: https://github.com/JustinOros
+
+import json
+import os
+import time
+import hashlib
+import logging
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import formatdate
+import requests
+from requests.adapters import HTTPAdapter
+
+# Sidecar file remembering the ETag / Last-Modified validators of each local pool
+STATE_FILE = ".ham-sync.json"
+
+# (connect, read) timeouts for every request
+TIMEOUT = (5, 20)
+
+# Outcome of syncing one pool: status is 'updated', 'unchanged' or 'failed';
+# diff is the PoolDiff against the previous local copy for updated pools
+SyncResult = namedtuple("SyncResult", "name path status bytes elapsed error diff")
+
+# Id-level difference between two versions of a pool. old/new hold only the questions
+# involved (removed + changed, added + changed); questions is the whole new pool, already parsed.
+# old_digest and digest are the sha256 of the previous and the new file's bytes
+class PoolDiff:
+    __slots__ = ("added", "removed", "changed", "old", "new", "questions", "old_digest", "reordered", "digest")
+
+    def __init__(self, added, removed, changed, old, new, questions, old_digest, reordered=False, digest=None):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.old = old
+        self.new = new
+        self.questions = questions
+        self.old_digest = old_digest
+        self.reordered = reordered
+        self.digest = digest
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return f"+{len(self.added)} -{len(self.removed)} ~{len(self.changed)}"
+
+def _by_id(questions):
+    return {q["id"]: q for q in questions if isinstance(q, dict) and "id" in q}
+
+# Compare two raw pool files by question id; raises ValueError if the new one isn't a JSON pool
+def diff_pools(old_raw, new_raw):
+    questions = json.loads(new_raw)
+    if not isinstance(questions, list):
+        raise ValueError("question pool is not a JSON list")
+    new = _by_id(questions)
+    try:
+        old = _by_id(json.loads(old_raw)) if old_raw else {}
+    except ValueError:
+        old = {}
+
+    added = [k for k in new if k not in old]
+    removed = [k for k in old if k not in new]
+    changed = [k for k in new if k in old and new[k] != old[k]]
+    return PoolDiff(added, removed, changed,
+                    {k: old[k] for k in removed + changed},
+                    {k: new[k] for k in added + changed},
+                    questions,
+                    hashlib.sha256(old_raw).digest() if old_raw else None,
+                    list(old) != list(new),
+                    hashlib.sha256(new_raw).digest())
+
+# Write bytes to a temp file in the same directory, then rename it over the target
+def atomic_write(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    mode = os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Load the saved validators; a missing or corrupt file just means "no validators"
+def load_state(state_path=STATE_FILE):
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state, state_path=STATE_FILE):
+    atomic_write(state_path, json.dumps(state, indent=2, sort_keys=True).encode("utf-8"))
+
+# One keep-alive session whose connection pool is large enough for every pool at once
+def make_session(pool_size=3):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Conditional request headers for a local pool, based on its saved validators
+def conditional_headers(local_path, validators):
+    if not os.path.exists(local_path):
+        return {}
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    elif not headers:
+        # No validators saved yet (first run): fall back to the file's own mtime
+        headers["If-Modified-Since"] = formatdate(os.path.getmtime(local_path), usegmt=True)
+    return headers
+
+# Fetch one pool; returns (SyncResult, new validators or None)
+def fetch_pool(session, name, url, local_path, validators, timeout=TIMEOUT):
+    start = time.perf_counter()
+    try:
+        r = session.get(url, headers=conditional_headers(local_path, validators), timeout=timeout)
+        if r.status_code == 304:
+            return SyncResult(name, local_path, "unchanged", 0, time.perf_counter() - start, None, None), None
+        r.raise_for_status()
+
+        # Diff against the current copy before it is replaced; a bad download never gets written
+        old_raw = None
+        if os.path.exists(local_path):
+            with open(local_path, "rb") as f:
+                old_raw = f.read()
+        diff = diff_pools(old_raw, r.content)
+        atomic_write(local_path, r.content)
+        new_validators = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+        return SyncResult(name, local_path, "updated", len(r.content), time.perf_counter() - start, None, diff), new_validators
+    except Exception as e:
+        logging.warning(f"Could not sync {name} from {url}: {e}")
+        return SyncResult(name, local_path, "failed", 0, time.perf_counter() - start, e, None), None
+
+# Sync every pool concurrently over one pooled session; returns {name: SyncResult}
+# progress, if given, is called with each SyncResult as soon as that pool finishes
+def sync_files(urls, local_files, state_path=STATE_FILE, session=None, timeout=TIMEOUT, progress=None):
+    state = load_state(state_path)
+    own_session = session is None
+    if own_session:
+        session = make_session(len(urls))
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(urls))) as pool:
+            futures = [
+                pool.submit(fetch_pool, session, name, url, local_files[name],
+                            state.get(local_files[name], {}), timeout)
+                for name, url in urls.items()
+            ]
+            results = {}
+            for future in as_completed(futures):
+                result, new_validators = future.result()
+                results[result.name] = result
+                if new_validators is not None:
+                    state[result.path] = new_validators
+                if progress is not None:
+                    progress(result)
+    finally:
+        if own_session:
+            session.close()
+
+    if any(r.status == "updated" for r in results.values()):
+        try:
+            save_state(state, state_path)
+        except OSError as e:
+            logging.warning(f"Could not save sync state to {state_path}: {e}")
+    return {name: results[name] for name in urls}